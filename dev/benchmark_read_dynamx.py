@@ -0,0 +1,30 @@
+"""Benchmark of the read_dynamx parser engines on a large DynamX state data file"""
+
+from pathlib import Path
+from pyhdx.fileIO import read_dynamx
+import tempfile
+import time
+
+current_dir = Path(__file__).parent
+data_dir = current_dir.parent / 'tests' / 'test_data'
+
+num_rows = 500000
+
+with open(data_dir / 'ecSecB_apo.csv', 'r') as f:
+    header = f.readline()
+    lines = f.readlines()
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    fpath = Path(tmp_dir) / 'large_dynamx.csv'
+    with open(fpath, 'w') as f:
+        f.write(header)
+        f.writelines(lines * (num_rows // len(lines)))
+
+    timings = {}
+    for engine in ['numpy', 'c']:
+        t0 = time.perf_counter()
+        data = read_dynamx(fpath, fpath, engine=engine)
+        timings[engine] = time.perf_counter() - t0
+        print(f"Engine '{engine}': {len(data)} rows in {timings[engine]:.2f} s")
+
+print(f"Speedup: {timings['numpy'] / timings['c']:.1f}x")
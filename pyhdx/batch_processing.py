@@ -30,7 +30,11 @@ def load_from_yaml(yaml_dict, data_dir=None, **kwargs):  #name: load what from y
     else:
         input_files = yaml_dict['filenames']
 
-    data = read_dynamx(*input_files)
+    # Only read the rows of the selected state and its FD control
+    states = [yaml_dict['series_name']]
+    if 'control' in yaml_dict.keys():
+        states.append(yaml_dict['control'][0])
+    data = read_dynamx(*input_files, states=states)
 
     pmt = PeptideMasterTable(data, d_percentage=yaml_dict['d_percentage'])  #todo add proline, n_term options
     if 'control' in yaml_dict.keys():  # Use a FD control for back exchange correction
@@ -1,14 +1,161 @@
 import numpy as np
 from numpy.lib.recfunctions import stack_arrays
 from io import StringIO
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import pandas as pd
+import hashlib
+import tempfile
+import os
 import pyhdx
 
 
-def read_dynamx(*file_paths, intervals=('inclusive', 'inclusive'), time_unit='min'):
+# Data types of the known columns of DynamX state data files, other columns are inferred
+DYNAMX_DTYPES = {
+    'protein': str,
+    'start': int,
+    'end': int,
+    'sequence': str,
+    'modification': str,
+    'fragment': str,
+    'maxuptake': float,
+    'mhp': float,
+    'state': str,
+    'exposure': float,
+    'center': float,
+    'center sd': float,
+    'uptake': float,
+    'uptake sd': float,
+    'rt': float,
+    'rt sd': float
+}
+
+
+class DataCache(object):
+    """
+    On-disk cache of parsed data files.
+
+    Parsed data is stored as .npy files in `cache_dir`, keyed by the hash of the contents of the input files and the
+    parsing options, such that repeated loads of the same files are memory mapped instead of parsed. When the total
+    size of the cache exceeds `max_size`, the least recently used entries are removed.
+
+    Parameters
+    ----------
+    cache_dir : :obj:`str` or :class:`~pathlib.Path`, optional
+        Cache directory, default is 'cache' in the PyHDX configuration directory (~/.pyhdx/cache).
+    max_size : :obj:`int`, optional
+        Maximum total size of the cache in bytes. Default is taken from the 'max_size' (MB) option in the 'cache'
+        section of the PyHDX configuration file, or 1024 MB.
+
+    """
+    def __init__(self, cache_dir=None, max_size=None):
+        if cache_dir is None or max_size is None:
+            from pyhdx.panel.config import ConfigurationSettings, config_dir
+            if cache_dir is None:
+                cache_dir = config_dir / 'cache'
+            if max_size is None:
+                max_size = int(ConfigurationSettings().get('cache', 'max_size', fallback=1024)) * 1024**2
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def key(self, file_paths, **options):
+        """
+        Returns the cache key of the data parsed from `file_paths` with `options`.
+
+        Parameters
+        ----------
+        file_paths : :obj:`iterable`
+            File paths or :class:`~io.StringIO` objects
+        options
+            Parsing options, values must have a unique string representation.
+
+        Returns
+        -------
+        key : :obj:`str`
+
+        """
+        h = hashlib.sha256()
+        for fpath in file_paths:
+            if isinstance(fpath, StringIO):
+                h.update(fpath.getvalue().encode('UTF-8'))
+            else:
+                with open(fpath, 'rb') as f:
+                    for block in iter(lambda: f.read(2**20), b''):
+                        h.update(block)
+            h.update(b'\0')  # Separates contents of subsequent files
+        h.update(repr(sorted(options.items())).encode('UTF-8'))
+
+        return h.hexdigest()
+
+    def load(self, key):
+        """
+        Returns the cached data for `key` as a copy-on-write memory mapped array, or `None` if `key` is not cached.
+
+        """
+        path = self.cache_dir / f'{key}.npy'
+        try:
+            data = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)  # Marks the entry as recently used
+
+        return data
+
+    def save(self, key, data):
+        """Stores `data` with key `key` and removes least recently used entries exceeding the maximum cache size."""
+        path = self.cache_dir / f'{key}.npy'
+        # Unique temporary file per writer, the suffix excludes it from eviction
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp.npy', delete=False) as f:
+            np.save(f, data)
+        tmp_path = f.name
+        try:
+            os.replace(tmp_path, path)  # Concurrent readers never see a partially written file
+        except PermissionError:  # Existing entry is memory mapped (Windows), which holds the same data
+            _remove_file(tmp_path)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the total size of the cache is below the maximum size."""
+        entries = [(path.stat(), path) for path in self.cache_dir.glob('*.npy') if not path.name.endswith('.tmp.npy')]
+        total_size = sum(stat.st_size for stat, path in entries)
+        for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime):
+            if total_size <= self.max_size:
+                break
+            if _remove_file(path):
+                total_size -= stat.st_size
+
+    def clear(self):
+        """Removes all cache entries, except entries which are memory mapped on Windows."""
+        for path in self.cache_dir.glob('*.npy'):
+            _remove_file(path)
+
+
+def _remove_file(path):
+    """
+    Removes the file at `path` and returns `True` if it was removed or did not exist. Returns `False` if the file is
+    in use, ie memory mapped on Windows.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        return False
+
+    return True
+
+
+def read_dynamx(*file_paths, intervals=('inclusive', 'inclusive'), time_unit='min', engine='c', cache=None,
+                states=None, exposures=None, residue_range=None, chunk_size=100000, max_workers=None):
     """
     Reads a dynamX .csv file and returns the data as a numpy structured array
 
+    Rows can be selected by state, exposure time and residue range. For the 'c' engine, files are then read in chunks
+    and only the selected rows of each chunk are kept, such that memory use is bounded by the size of the selection.
+
     Parameters
     ----------
     file_paths : :obj:`iterable`
@@ -17,6 +164,26 @@ def read_dynamx(*file_paths, intervals=('inclusive', 'inclusive'), time_unit='mi
         Format of how start and end intervals are specified.
     time_unit : :obj:`str`
         Not implemented
+    engine : :obj:`str`
+        Parser engine. 'c' (default) parses files with the :func:`~pandas.read_csv` C engine using the data types
+        in `DYNAMX_DTYPES` for known columns. 'numpy' uses :func:`~numpy.genfromtxt`, which infers data types of
+        all columns and returns a masked array when multiple files are read.
+    cache : :obj:`bool` or :class:`~pyhdx.fileIO.DataCache`, optional
+        If `True` or a :class:`~pyhdx.fileIO.DataCache`, parsed data is stored in and loaded from the on-disk cache
+        (default ~/.pyhdx/cache). Cached data is returned as a copy-on-write memory mapped array. Not supported for
+        the 'numpy' engine.
+    states : :obj:`list`, optional
+        Names of states to select. Include the state of the FD control when it is used for back-exchange correction.
+    exposures : :obj:`list`, optional
+        Exposure times to select.
+    residue_range : :obj:`tuple`, optional
+        Tuple of first and last residue number (inclusive). Peptides are selected when all their residues are within
+        the range.
+    chunk_size : :obj:`int`
+        Number of rows per chunk when reading files with selected rows.
+    max_workers : :obj:`int`, optional
+        Maximum number of threads used to parse multiple files concurrently. Default is the number of files, limited
+        to the number of CPUs. Set to 1 to parse files sequentially.
 
     Returns
     -------
@@ -24,22 +191,23 @@ def read_dynamx(*file_paths, intervals=('inclusive', 'inclusive'), time_unit='mi
         Peptides as a numpy structured array
 
     """
+    predicates = {'states': states, 'exposures': exposures, 'residue_range': residue_range}
+
+    if cache:
+        if engine != 'c':
+            raise ValueError("Caching is only supported for the 'c' engine")
+        cache = DataCache() if cache is True else cache
+        selection = {name: value for name, value in predicates.items() if value is not None}
+        key = cache.key(file_paths, intervals=intervals, engine=engine, **selection)
+        data = cache.load(key)
+        if data is not None:
+            return data
+        data = read_dynamx(*file_paths, intervals=intervals, time_unit=time_unit, engine=engine, chunk_size=chunk_size,
+                           max_workers=max_workers, **predicates)
+        cache.save(key, data)
+
+        return data
 
-    data_list = []
-    for fpath in file_paths:
-        # names = [t[0] for t in CSV_DTYPE]
-        if isinstance(fpath, StringIO):
-            hdr = fpath.readline().strip('# \n\t')
-            fpath.seek(0)
-        else:
-            with open(fpath, 'r') as f:
-                hdr = f.readline().strip('# \n\t')
-
-        names = [name.lower() for name in hdr.split(',')]
-        data = np.genfromtxt(fpath, skip_header=1, delimiter=',', dtype=None, names=names, encoding='UTF-8')
-        data_list.append(data)
-
-    full_data = stack_arrays(data_list, usemask=True, autoconvert=True)
     if intervals[0] == 'inclusive':
         start_correction = 0
     elif intervals[0] == 'exclusive':
@@ -53,10 +221,97 @@ def read_dynamx(*file_paths, intervals=('inclusive', 'inclusive'), time_unit='mi
     else:
         raise ValueError(f"Invalid start interval value {intervals[1]}, must be 'inclusive' or 'exclusive'")
 
+    if engine not in ['c', 'numpy']:
+        raise ValueError(f"Invalid value for 'engine': {engine}, must be 'c' or 'numpy'")
+
+    select = any(value is not None for value in predicates.values())
+    parse = partial(_read_dynamx_file, engine=engine, corrections=(start_correction, end_correction),
+                    predicates=predicates if select else None, chunk_size=chunk_size)
+
+    max_workers = max_workers or min(len(file_paths), os.cpu_count() or 1)
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            data_list = list(executor.map(parse, file_paths))
+    else:
+        data_list = [parse(fpath) for fpath in file_paths]
+
+    if engine == 'c':
+        return dataframe_to_np(pd.concat(data_list, ignore_index=True, copy=False))
+
+    full_data = stack_arrays(data_list, usemask=True, autoconvert=True)
     full_data['start'] += start_correction
     full_data['end'] += end_correction
 
-    return full_data
+    return full_data[_select_rows(full_data, **predicates)] if select else full_data
+
+
+def _read_dynamx_file(fpath, engine='c', corrections=(0, 1), predicates=None, chunk_size=100000):
+    """
+    Parses a single dynamX .csv file, see :func:`~pyhdx.fileIO.read_dynamx`. For the 'c' engine, a
+    :class:`~pandas.DataFrame` with corrected intervals and selected rows is returned, for the 'numpy' engine the
+    uncorrected structured array.
+    """
+    # names = [t[0] for t in CSV_DTYPE]
+    if isinstance(fpath, StringIO):
+        hdr = fpath.readline().strip('# \n\t')
+        fpath.seek(0)
+    else:
+        with open(fpath, 'r') as f:
+            hdr = f.readline().strip('# \n\t')
+
+    names = [name.lower() for name in hdr.split(',')]
+    if engine == 'numpy':
+        return np.genfromtxt(fpath, skip_header=1, delimiter=',', dtype=None, names=names, encoding='UTF-8')
+
+    dtype = {name: DYNAMX_DTYPES[name] for name in names if name in DYNAMX_DTYPES}
+    reader = pd.read_csv(fpath, skiprows=1, header=None, names=names, dtype=dtype, engine='c',
+                         keep_default_na=False, na_values={name: [''] for name in names
+                                                           if dtype.get(name, str) is not str},
+                         chunksize=chunk_size if predicates else None)
+    chunks = []
+    for chunk in (reader if predicates else [reader]):
+        chunk['start'] += corrections[0]
+        chunk['end'] += corrections[1]
+        chunks.append(chunk[_select_rows(chunk, **predicates)] if predicates else chunk)
+
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True, copy=False)
+
+
+def _select_rows(data, states=None, exposures=None, residue_range=None):
+    """Returns a boolean mask of rows of `data` (structured array or DataFrame) matching all selection criteria"""
+    mask = np.ones(len(data), dtype=bool)
+    if states is not None:
+        mask &= np.isin(np.asarray(data['state']), states)
+    if exposures is not None:
+        mask &= np.isin(np.asarray(data['exposure']), exposures)
+    if residue_range is not None:
+        first, last = residue_range
+        mask &= (np.asarray(data['start']) >= first) & (np.asarray(data['end']) - 1 <= last)  # End is exclusive
+
+    return mask
+
+
+def dataframe_to_np(df):
+    """
+    Converts a :class:`~pandas.DataFrame` to a numpy structured array. Columns of strings are converted to fixed-width
+    unicode fields and spaces in column names are replaced by underscores.
+
+    """
+    columns = {}
+    for name, column in df.items():
+        if column.dtype == object:
+            # Convert unique values only, missing values (code -1) are converted to empty strings
+            codes, uniques = pd.factorize(column)
+            uniques = np.append(np.asarray(uniques, dtype=str), '')
+            columns[name.replace(' ', '_')] = uniques[codes]
+        else:
+            columns[name.replace(' ', '_')] = column.to_numpy()
+
+    array = np.empty(len(df), dtype=[(name, values.dtype) for name, values in columns.items()])
+    for name, values in columns.items():
+        array[name] = values
+
+    return array
 
 
 def csv_to_np(file_path, delimiter='\t', column_depth=None):
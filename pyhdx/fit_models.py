@@ -1,13 +1,20 @@
 import numpy as np
 from symfit import Parameter, Variable, Model, exp
 from scipy.optimize import fsolve
+import threading
 
 
 class KineticsModel(object):
     """
-    Base class for kinetics models. Main function is to generate :ref:`symfit` Variables and Parameters. The class
-    attributes `par_index` and `var_index` are used to make sure names used by :ref:`symfit` are unique and their
-    mapping to user-defined names are stored in the `names` dictionary.
+    Base class for kinetics models. Main function is to generate :ref:`symfit` Variables and Parameters. Subclasses
+    declare their parameters and variables with `make_parameter` and `make_variable` and implement `make_sf_model` to
+    create the :ref:`symfit` model from the corresponding symbols.
+
+    The :ref:`symfit` model is created and compiled only once per subclass and is shared between all instances as a
+    template. Values and bounds of parameters are stored per instance in `param_state` and are applied to a private
+    copy of the shared model returned by `bind`. The dummy names used by :ref:`symfit` are derived from the subclass
+    name and are therefore identical across threads and processes. Their mapping to user-defined names is stored in
+    the `names` dictionary.
 
     Parameters
     ----------
@@ -20,24 +27,45 @@ class KineticsModel(object):
 
     names : :obj:`dict`
         Dictionary which maps human-readable names (keys) to dummy names (values)
-    sf_model : :class:`~symfit.Model`
-        The `symfit` model which describes this model. Implemented by subclasses.
+    param_state : :obj:`dict`
+        Dictionary which maps dummy names of parameters to dictionaries with their `value`, `min` and `max`.
 
     """
 
-    par_index = 0
-    var_index = 0
+    _templates = {}  # Subclass: shared symfit model
+    _lock = threading.Lock()
 
     def __init__(self, bounds):
         if bounds[1] < bounds[0]:
             raise ValueError('Lower bound must be smaller than upper bound')
         self.bounds = bounds
         self.names = {}  # human name: dummy name
-        self.sf_model = None
+        self.param_state = {}  # dummy name: {'value': value, 'min': min, 'max': max}
+
+    def make_sf_model(self, **symbols):
+        """
+        Create the :ref:`symfit` model. Called only once per subclass.
+
+        Parameters
+        ----------
+        symbols : :obj:`dict`
+            Dictionary with human-readable names as keys and corresponding :class:`~symfit.Parameter` or
+            :class:`~symfit.Variable` as values.
+
+        Returns
+        -------
+        sf_model : :class:`~symfit.Model`
+
+        """
+        raise NotImplementedError()
+
+    def _dummy_name(self, prefix):
+        # Numbered in order of declaration, which determines the order of parameters in the symfit model
+        return 'pyhdx_{}_{}_{}'.format(prefix, self.__class__.__name__, len(self.names))
 
     def make_parameter(self, name, value=None, min=None, max=None):
         """
-        Create a new :class:`~symfit.Parameter`.
+        Declare a new parameter for this model.
 
         Parameters
         ----------
@@ -50,49 +78,87 @@ class KineticsModel(object):
         max : :obj:`float`
             Lower bound value. If `None`, the value from `bounds` is used.
 
-        Returns
-        -------
-        p : :class:`~symfit.Parameter`
-
         """
         min = min if min is not None else self.bounds[0]
         max = max if max is not None else self.bounds[1]
 
         value = value or np.mean(self.bounds)
-        dummy_name = 'pyhdx_par_{}'.format(self.par_index)
-        KineticsModel.par_index += 1
-        p = Parameter(dummy_name, value=value, min=min, max=max)
+        dummy_name = self._dummy_name('par')
+        self.param_state[dummy_name] = {'value': value, 'min': min, 'max': max}
         self.names[name] = dummy_name
-        return p
 
     def make_variable(self, name):
         """
-        Create a new :class:`~symfit.Variable`.
+        Declare a new variable for this model.
 
         Parameters
         ----------
         name : :obj:`str`
             Human-readable name for the variable
 
+        """
+        dummy_name = self._dummy_name('var')
+        self.names[name] = dummy_name
+
+    @property
+    def sf_model(self):
+        """:class:`~symfit.Model`: The `symfit` model which describes this model, shared between instances."""
+        cls = self.__class__
+        try:
+            return self._templates[cls]
+        except KeyError:
+            pass
+
+        with KineticsModel._lock:
+            if cls not in self._templates:
+                symbols = {name: Parameter(dummy_name) if dummy_name in self.param_state else Variable(dummy_name)
+                           for name, dummy_name in self.names.items()}
+                KineticsModel._templates[cls] = self.make_sf_model(**symbols)
+
+        return self._templates[cls]
+
+    def bind(self):
+        """
+        Returns a copy of the shared `symfit` model with private parameters, which hold the values and bounds of this
+        instance. The copy reuses the compiled components of the shared model and can be fitted concurrently with
+        copies bound by other instances.
+
         Returns
         -------
-        p : :class:`~symfit.Variable`
+        sf_model : :class:`~symfit.Model`
 
         """
-        dummy_name = 'pyhdx_var_{}'.format(self.var_index)
-        KineticsModel.var_index += 1
-        v = Variable(dummy_name)
-        self.names[name] = dummy_name
-        return v
+        sf_model = self.sf_model
+        bound_model = object.__new__(sf_model.__class__)
+        bound_model.__dict__.update(sf_model.__dict__)  # copy.copy drops the cached compiled components
+        bound_model.params = [_private_parameter(p.name, **self.param_state[p.name]) for p in sf_model.params]
+
+        return bound_model
 
     @property
     def r_names(self):
         """:obj:`dict`: Reverse dictionary of the variable and parameter names"""
         return {v: k for k, v in self.names.items()}
 
+    def set_value(self, name, value):
+        """
+        Set the initial guess value of parameter with human-readable name `name`
+
+        Parameters
+        ----------
+        name : :obj:`str`
+            Name of the parameter
+        value : :obj:`float`
+            Initial guess value
+
+        """
+        self.param_state[self.names[name]]['value'] = value
+
     def get_parameter(self, name):
         """
-        Get the parameter with the Human-readable name `name`
+        Get the parameter with the Human-readable name `name`. The returned parameter is shared between instances and
+        its value and bounds are not used for fitting, use `param_state` or `set_value` to access the values of this
+        instance.
 
         Parameters
         ----------
@@ -111,6 +177,13 @@ class KineticsModel(object):
         return parameter
 
 
+def _private_parameter(name, value, min, max):
+    # sympy caches symbols by name, Parameter(name) would return the parameter of the shared model
+    parameter = Parameter.__xnew__(Parameter, name)
+    parameter.__init__(name, value=value, min=min, max=max)
+    return parameter
+
+
 class SingleKineticModel(KineticsModel):
     """
     Base class for models which fit only a single set (slice) of time, uptake points
@@ -122,13 +195,14 @@ class TwoComponentAssociationModel(SingleKineticModel):
     def __init__(self, bounds):
         super(TwoComponentAssociationModel, self).__init__(bounds)
 
-        r = self.make_parameter('r', value=0.5, min=0, max=1)
-        k1 = self.make_parameter('k1')
-        k2 = self.make_parameter('k2')
-        t = self.make_variable('t')
-        y = self.make_variable('y')
+        self.make_parameter('r', value=0.5, min=0, max=1)
+        self.make_parameter('k1')
+        self.make_parameter('k2')
+        self.make_variable('t')
+        self.make_variable('y')
 
-        self.sf_model = Model({y: (1 - (r * exp(-k1*t) + (1 - r) * exp(-k2*t)))})
+    def make_sf_model(self, r, k1, k2, t, y):
+        return Model({y: (1 - (r * exp(-k1*t) + (1 - r) * exp(-k2*t)))})
 
     def __call__(self, t, **params):
         """call model at time t, returns uptake values of peptides"""
@@ -151,12 +225,9 @@ class TwoComponentAssociationModel(SingleKineticModel):
         k1_v = fsolve(func_short_ass, 1 / 2, args=(t[2], d[2]))[0]
         k2_v = fsolve(func_long_ass, 1 / 20, args=(t[-2], d[-2], k1_v))[0]
 
-        k1_p = self.get_parameter('k1')
-        k1_p.value = k1_v
-        k2_p = self.get_parameter('k2')
-        k2_p.value = k2_v
-        r_p = self.get_parameter('r')
-        r_p.value = 0.5
+        self.set_value('k1', k1_v)
+        self.set_value('k2', k2_v)
+        self.set_value('r', 0.5)
 
     def initial_grid(self, t, d, step=15):
         kmax = 5 * np.log(1-0.98) / -t[1]
@@ -183,23 +254,11 @@ class TwoComponentAssociationModel(SingleKineticModel):
 
         """
 
-        #todo generalize duplicate code for other models
         r = params[self.names['r']]
         k1 = params[self.names['k1']]
         k2 = params[self.names['k2']]
 
-        #tau = r * tau1 + (1 - r) * tau2
-
-        x0 = k1 if r > 0.5 else k2
-
-        t_log = fsolve(self.min_func, np.log(x0), args=(k1, k2, r))
-        try:
-            assert np.round(self.min_func(t_log, k1, k2, r), 5) == 0, 'Failed to find half life root'
-        except AssertionError:
-            print('uhoh')
-            print(k1, k2, r)
-            print(np.round(self.min_func(t_log, k1, k2, r), 5) == 0)
-        k = np.asscalar(np.log(2) / np.exp(t_log))
+        k = float(two_component_rate(k1, k2, r))
 
         return k
 
@@ -229,11 +288,12 @@ class OneComponentAssociationModel(SingleKineticModel):
     """One component Association"""
     def __init__(self, bounds):
         super(OneComponentAssociationModel, self).__init__(bounds)
-        k1 = self.make_parameter('k1')
-        t = self.make_variable('t')
-        y = self.make_variable('y')
+        self.make_parameter('k1')
+        self.make_variable('t')
+        self.make_variable('y')
 
-        self.sf_model = Model({y: (1 - exp(-k1*t))})
+    def make_sf_model(self, k1, t, y):
+        return Model({y: (1 - exp(-k1*t))})
 
     def __call__(self, t, **params):
         """call model at time t, returns uptake values of peptides"""
@@ -256,8 +316,7 @@ class OneComponentAssociationModel(SingleKineticModel):
         """
         k1_v = fsolve(func_short_ass, 1 / 2, args=(t[3], d[3]))[0]
 
-        k1_p = self.get_parameter('k1')
-        k1_p.value = k1_v
+        self.set_value('k1', k1_v)
 
     def get_rate(self, **params):
         k1 = params[self.names['k1']]
@@ -273,13 +332,14 @@ class TwoComponentDissociationModel(SingleKineticModel):
     def __init__(self, bounds):
         super(TwoComponentDissociationModel, self).__init__(bounds)
 
-        r = self.make_parameter('r', value=0.5, min=0, max=1)
-        k1 = self.make_parameter('k1')
-        k2 = self.make_parameter('k2')
-        t = self.make_variable('t')
-        y = self.make_variable('y')
+        self.make_parameter('r', value=0.5, min=0, max=1)
+        self.make_parameter('k1')
+        self.make_parameter('k2')
+        self.make_variable('t')
+        self.make_variable('y')
 
-        self.sf_model = Model({y: (r * exp(-k1*t) + (1 - r) * exp(-k2*t))})
+    def make_sf_model(self, r, k1, k2, t, y):
+        return Model({y: (r * exp(-k1*t) + (1 - r) * exp(-k2*t))})
 
     def __call__(self, t, **params):
         """call model at time t, returns uptake values of peptides"""
@@ -302,12 +362,9 @@ class TwoComponentDissociationModel(SingleKineticModel):
         k1_v = fsolve(func_short_ass, 1 / 2, args=(t[2], d[2]))[0]
         k2_v = fsolve(func_long_ass, 1 / 20, args=(t[-2], d[-2], k1_v))[0]
 
-        k1_p = self.get_parameter('k1')
-        k1_p.value = k1_v
-        k2_p = self.get_parameter('k2')
-        k2_p.value = k2_v
-        r_p = self.get_parameter('r')
-        r_p.value = 0.5
+        self.set_value('k1', k1_v)
+        self.set_value('k2', k2_v)
+        self.set_value('r', 0.5)
 
     def initial_grid(self, t, d, step=15):
         kmax = 5 * np.log(1-0.98) / -t[1]
@@ -334,23 +391,11 @@ class TwoComponentDissociationModel(SingleKineticModel):
 
         """
 
-        #todo generalize duplicate code for other models
         r = params[self.names['r']]
         k1 = params[self.names['k1']]
         k2 = params[self.names['k2']]
 
-        #tau = r * tau1 + (1 - r) * tau2
-
-        x0 = k1 if r > 0.5 else k2
-
-        t_log = fsolve(self.min_func, np.log(x0), args=(k1, k2, r))
-        try:
-            assert np.round(self.min_func(t_log, k1, k2, r), 5) == 0, 'Failed to find half life root'
-        except AssertionError:
-            print('uhoh')
-            print(k1, k2, r)
-            print(np.round(self.min_func(t_log, k1, k2, r), 5) == 0)
-        k = np.asscalar(np.log(2) / np.exp(t_log))
+        k = float(two_component_rate(k1, k2, r))
 
         return k
 
@@ -380,11 +425,12 @@ class OneComponentDissociationModel(SingleKineticModel):
     """One component Association"""
     def __init__(self, bounds):
         super(OneComponentDissociationModel, self).__init__(bounds)
-        k1 = self.make_parameter('k1')
-        t = self.make_variable('t')
-        y = self.make_variable('y')
+        self.make_parameter('k1')
+        self.make_variable('t')
+        self.make_variable('y')
 
-        self.sf_model = Model({y: exp(-k1*t)})
+    def make_sf_model(self, k1, t, y):
+        return Model({y: exp(-k1*t)})
 
     def __call__(self, t, **params):
         """call model at time t, returns uptake values of peptides"""
@@ -407,8 +453,7 @@ class OneComponentDissociationModel(SingleKineticModel):
         """
         k1_v = fsolve(func_short_ass, 1 / 2, args=(t[3], d[3]))[0]
 
-        k1_p = self.get_parameter('k1')
-        k1_p.value = k1_v
+        self.set_value('k1', k1_v)
 
     def get_rate(self, **params):
         k1 = params[self.names['k1']]
@@ -419,6 +464,49 @@ class OneComponentDissociationModel(SingleKineticModel):
         return 1/k
 
 
+def two_component_rate(k1, k2, r, num_iter=64):
+    """
+    Calculate the effective exchange rates of two-component kinetics from their half-life times.
+
+    The half-life time t½ is the solution of r * exp(-k1 * t) + (1 - r) * exp(-k2 * t) = 0.5, which is the same
+    equation for association and dissociation models. The root is found for all inputs simultaneously by bisection in
+    logarithmic time, within the bracket [ln(2) / max(k1, k2), ln(2) / min(k1, k2)].
+
+    Parameters
+    ----------
+    k1 : :obj:`float` or :class:`~numpy.ndarray`
+        Rate constants of the first component
+    k2 : :obj:`float` or :class:`~numpy.ndarray`
+        Rate constants of the second component
+    r : :obj:`float` or :class:`~numpy.ndarray`
+        Relative amplitudes of the first component
+    num_iter : :obj:`int`
+        Number of bisection iterations
+
+    Returns
+    -------
+    k : :class:`~numpy.ndarray`
+        Array of effective rates ln(2) / t½. NaN where any of the inputs is NaN.
+
+    """
+    k1, k2, r = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in [k1, k2, r]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_lower = np.log(np.log(2) / np.fmax(k1, k2))
+        log_upper = np.log(np.log(2) / np.fmin(k1, k2))
+
+        for i in range(num_iter):
+            log_t = (log_lower + log_upper) / 2
+            t = np.exp(log_t)
+            above = r * np.exp(-k1 * t) + (1 - r) * np.exp(-k2 * t) > 0.5  # Root is at larger t
+            log_lower = np.where(above, log_t, log_lower)
+            log_upper = np.where(above, log_upper, log_t)
+
+        k = np.log(2) / np.exp((log_lower + log_upper) / 2)
+
+    nan = np.isnan(k1) | np.isnan(k2) | np.isnan(r)
+    return np.where(nan, np.nan, k)
+
+
 def func_short_dis(k, tt, A):
     """
     Function to estimate the fast time component
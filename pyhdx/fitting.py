@@ -1,10 +1,11 @@
 from pyhdx.support import get_reduced_blocks, temporary_seed
-from pyhdx.models import Protein, HDXMeasurementSet
-from pyhdx.fitting_torch import DeltaGFit, TorchSingleFitResult, TorchBatchFitResult
+from pyhdx.models import Protein, HDXMeasurementSet, HDXMeasurementReference
+from pyhdx.fitting_torch import DeltaGFit, BlockDeltaGFit, coverage_matmul, TorchFitResult, TorchSingleFitResult, TorchBatchFitResult, \
+    TorchRegularizationPathResult, TorchResamplingResult, TorchCrossValidationResult
 from pyhdx.fit_models import SingleKineticModel, OneComponentAssociationModel, TwoComponentAssociationModel, OneComponentDissociationModel, \
-    TwoComponentDissociationModel
+    TwoComponentDissociationModel, two_component_rate
 from scipy import constants
-from scipy.optimize import fsolve
+from scipy.optimize import fsolve, minimize
 import torch
 import numpy as np
 from symfit import Fit, Variable, Parameter, exp, Model, CallableModel
@@ -12,16 +13,171 @@ from symfit.core.minimizers import DifferentialEvolution, Powell
 from collections import namedtuple
 from functools import reduce, partial
 from operator import add
-from dask.distributed import Client, worker_client
+from dask.distributed import Client, worker_client, as_completed, Variable as DaskVariable, Event as DaskEvent
 import dask
+import asyncio
+import threading
+import time
 import warnings
 import pandas as pd
-from itertools import repeat
+from itertools import repeat, product
 
 
 EmptyResult = namedtuple('EmptyResult', ['chi_squared', 'params'])
 er = EmptyResult(np.nan, {k: np.nan for k in ['tau1', 'tau2', 'r']})
 
+# Result of a single block in vectorized kinetics fitting, `params` keys are the model's dummy parameter names
+KineticsResult = namedtuple('KineticsResult', ['chi_squared', 'params'])
+
+
+def compact_result(fit_result):
+    """
+    Marks a fit result, or a list or dictionary of fit results, to be serialized in compact form. Used to return fit
+    results from Dask workers to a client which holds the fitted data.
+
+    Parameters
+    ----------
+    fit_result : :class:`~pyhdx.fitting_torch.TorchFitResult` or :class:`~pyhdx.fitting.KineticsFitResult`
+        Fit result(s) to compact. Other objects are returned unchanged.
+
+    Returns
+    -------
+    fit_result
+        The same fit result(s)
+
+    """
+    if isinstance(fit_result, list):
+        return [compact_result(result) for result in fit_result]
+    elif isinstance(fit_result, dict):
+        return {k: compact_result(v) for k, v in fit_result.items()}
+    elif hasattr(fit_result, 'compact'):
+        return fit_result.compact()
+    else:
+        return fit_result
+
+
+def fit_compact(fit_func, *args, **kwargs):
+    """
+    Calls the fitting function `fit_func` and returns its result(s) marked to be serialized in compact form. Submit to
+    Dask in place of `fit_func` such that only the compact fit result is returned from the worker.
+
+    Parameters
+    ----------
+    fit_func : :obj:`callable`
+        Fitting function
+    args
+        Positional arguments passed to `fit_func`
+    kwargs
+        Keyword arguments passed to `fit_func`
+
+    Returns
+    -------
+    fit_result
+        Fit result(s) returned by `fit_func`, see :func:`compact_result`
+
+    """
+    return compact_result(fit_func(*args, **kwargs))
+
+
+class FitProgress(object):
+    """
+    Reports the progress of fits and allows fits to be cancelled.
+
+    Instances are passed as `callback` to fitting functions, which call them with the current step (epoch or
+    iteration), the maximum number of steps and the current loss. Calls return `True` when the fit is cancelled,
+    after which the fitting function stops and returns its current result.
+
+    Progress is reported through a Dask :class:`~distributed.Variable` and cancellation through a Dask
+    :class:`~distributed.Event` if `name` is given, such that a fit running on a Dask worker can be monitored and
+    cancelled from the client. Otherwise, progress and cancellation are local to the process.
+
+    Parameters
+    ----------
+    name : :obj:`str`, optional
+        Name of the Dask variable and event. Required when the fit is submitted to a Dask cluster.
+    client : :class:`~distributed.Client`, optional
+        Dask client used by the client side, ie to read progress and to cancel. Defaults to the current client.
+    interval : :obj:`float`
+        Minimum time in seconds between progress updates and checks for cancellation.
+    timeout : :obj:`float`
+        Maximum time in seconds to wait for the Dask scheduler, or for the first progress report, when reading progress.
+
+    """
+
+    def __init__(self, name=None, client=None, interval=0.5, timeout=1.):
+        self.name = name
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self._local = {'progress': None, 'event': threading.Event()} if name is None else None
+        self._last_update = -np.inf
+        self._start_time = None
+        self._cancelled = False
+
+    def __getstate__(self):
+        if self.name is None:
+            raise ValueError("Only named FitProgress objects can be sent to Dask workers")
+        state = self.__dict__.copy()
+        state['client'] = None
+        return state
+
+    def __call__(self, step, num_steps, loss):
+        now = time.time()
+        if self._start_time is None:
+            self._start_time = now
+        if now - self._last_update < self.interval and step + 1 < num_steps:
+            return self._cancelled
+
+        self._last_update = now
+        elapsed = now - self._start_time
+        progress = {
+            'step': step + 1,
+            'num_steps': num_steps,
+            'loss': float(np.sum(loss)),
+            'elapsed': elapsed,
+            'eta': elapsed / (step + 1) * (num_steps - step - 1)  # Upper bound, fits may terminate early
+        }
+
+        if self.name is None:
+            self._local['progress'] = progress
+            self._cancelled = self._local['event'].is_set()
+        else:
+            DaskVariable(self.name).set(progress)
+            self._cancelled = DaskEvent(f'{self.name}_cancel').is_set()
+
+        return self._cancelled
+
+    @property
+    def progress(self):
+        """:obj:`dict`: Most recent progress with keys 'step', 'num_steps', 'loss', 'elapsed' and 'eta' (seconds), or
+        `None` if no progress was reported yet or the Dask scheduler did not respond within `timeout`"""
+        if self.name is None:
+            return self._local['progress']
+        try:
+            return DaskVariable(self.name, client=self.client).get(timeout=self.timeout)
+        except (TimeoutError, asyncio.TimeoutError):  # Distinct exception types before Python 3.11
+            return None
+
+    def cancel(self):
+        """Request cancellation of the fit"""
+        if self.name is None:
+            self._local['event'].set()
+        else:
+            DaskEvent(f'{self.name}_cancel', client=self.client).set()
+
+    @property
+    def cancelled(self):
+        """:obj:`bool`: `True` if cancellation was requested"""
+        if self.name is None:
+            return self._local['event'].is_set()
+        return DaskEvent(f'{self.name}_cancel', client=self.client).is_set()
+
+    def close(self):
+        """Removes the Dask variable and event from the scheduler, call when the fit has finished"""
+        if self.name is not None:
+            DaskVariable(self.name, client=self.client).delete()
+            DaskEvent(f'{self.name}_cancel', client=self.client).clear()  # Cleared events are removed
+
 
 # ------------------------------------- #
 # Rates fitting
@@ -131,7 +287,8 @@ def fit_rates_half_time_interpolate(hdxm):
     return result
 
 
-def fit_rates_weighted_average(hdxm, bounds=None, chisq_thd=20, model_type='association', client=None, pbar=None):
+def fit_rates_weighted_average(hdxm, bounds=None, chisq_thd=20, model_type='association', client=None,
+                               callback=None):
     """
     Fit a model specified by 'model_type' to D-uptake kinetics. D-uptake is weighted averaged across peptides per
     timepoint to obtain residue-level D-uptake.
@@ -150,8 +307,10 @@ def fit_rates_weighted_average(hdxm, bounds=None, chisq_thd=20, model_type='asso
         in the local thread in a for loop. :class: Dask Client : Uses the supplied Dask client to schedule fitting task.
         `worker_client`: The function was ran by a Dask worker and the additional fitting tasks created are scheduled
         on the same Cluster.
-    pbar:
-        Not implemented
+    callback : :obj:`callable`, optional
+        Called after each fitted block with arguments the number of fitted blocks minus one, the total number of blocks
+        and the chi squared value. If it returns `True`, fitting is stopped and only finished blocks are included in
+        the result. See :class:`~pyhdx.fitting.FitProgress`.
 
     Returns
     -------
@@ -160,27 +319,91 @@ def fit_rates_weighted_average(hdxm, bounds=None, chisq_thd=20, model_type='asso
 
     """
     d_list, intervals, models = _prepare_wt_avg_fit(hdxm, model_type=model_type, bounds=bounds)
-    if pbar:
-        raise NotImplementedError()
-    else:
-        inc = lambda: None
 
     results = []
 
     if client is None:
-        for d, model in zip(d_list, models):
+        for i, (d, model) in enumerate(zip(d_list, models)):
             result = fit_kinetics(hdxm.timepoints, d, model, chisq_thd=chisq_thd)
             results.append(result)
+            if callback is not None and callback(i, len(d_list), result.chi_squared):
+                break
+        results += [None] * (len(d_list) - len(results))
     else:
         iterables = [[hdxm.timepoints]*len(d_list), d_list, models]
 
         if isinstance(client, Client):
             futures = client.map(fit_kinetics, *iterables, chisq_thd=chisq_thd)
-            results = client.gather(futures)
+            results = _gather_futures(client, futures, callback)
         elif client == 'worker_client':
             with worker_client() as client:
                 futures = client.map(fit_kinetics, *iterables, chisq_thd=chisq_thd)
-                results = client.gather(futures)
+                results = _gather_futures(client, futures, callback)
+
+    # Blocks which were not fitted because the fit was cancelled are omitted, the result is empty if no block was fitted
+    fitted = [i for i, result in enumerate(results) if result is not None]
+    intervals, results, models = ([items[i] for i in fitted] for items in (intervals, results, models))
+    fit_result = KineticsFitResult(hdxm, intervals, results, models)
+
+    return fit_result
+
+
+def _gather_futures(client, futures, callback=None):
+    """
+    Gathers the results of `futures` in order. If `callback` is given, it is called with the number of finished futures
+    minus one, the total number of futures and the chi squared value of the result, remaining futures are cancelled
+    when it returns `True`. The results of cancelled futures are `None`.
+    """
+    if callback is None:
+        return client.gather(futures)
+
+    results = {}
+    for i, future in enumerate(as_completed(futures)):
+        results[future.key] = future.result()
+        if callback(i, len(futures), results[future.key].chi_squared):
+            client.cancel(futures)
+            break
+
+    return [results.get(future.key) for future in futures]
+
+
+def fit_rates_weighted_average_vectorized(hdxm, bounds=None, model_type='association', max_iter=100, callback=None):
+    """
+    Fit a two-component model specified by 'model_type' to D-uptake kinetics of all residue blocks simultaneously.
+    D-uptake is weighted averaged across peptides per timepoint to obtain residue-level D-uptake.
+
+    Instead of a separate fit per block, all blocks are fitted at once by vectorized Levenberg-Marquardt optimization,
+    see :func:`~pyhdx.fitting.fit_kinetics_vectorized`.
+
+    Parameters
+    ----------
+    hdxm : :class:`~pyhdx.models.HDXMeasurement`
+    bounds : :obj:`tuple`, optional
+        Tuple of lower and upper bounds of rate constants in the model used.
+    model_type : :obj:`str`
+        Either 'association' or 'dissociation'
+    max_iter : :obj:`int`
+        Maximum number of Levenberg-Marquardt iterations
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
+
+    Returns
+    -------
+
+    fit_result : :class:`~pyhdx.fitting.KineticsFitResult`
+
+    """
+    bounds = bounds or get_bounds(hdxm.timepoints)
+    d_list, intervals, models = _prepare_wt_avg_fit(hdxm, model_type=model_type, bounds=bounds)
+
+    values, chi_squared = fit_kinetics_vectorized(hdxm.timepoints, np.array(d_list), bounds,
+                                                  model_type=model_type, max_iter=max_iter, callback=callback)
+
+    results = []
+    for model, (k1, k2, r), chisq in zip(models, values, chi_squared):
+        params = {model.names['k1']: k1, model.names['k2']: k2, model.names['r']: r}
+        results.append(KineticsResult(chisq, params))
 
     fit_result = KineticsFitResult(hdxm, intervals, results, models)
 
@@ -195,7 +418,8 @@ def fit_rates(hdxm, method='wt_avg', **kwargs):
     ----------
     hdxm : :class:`~pyhdx.models.HDXMeasurement`
     method : :obj:`str`
-        Method to use to determine rates of exchange
+        Method to use to determine rates of exchange. Options are 'wt_avg' (one fit per residue block) and
+        'wt_avg_vectorized' (all residue blocks fitted simultaneously).
     kwargs
         Additional kwargs passed to fitting
 
@@ -208,6 +432,8 @@ def fit_rates(hdxm, method='wt_avg', **kwargs):
 
     if method == 'wt_avg':
         result = fit_rates_weighted_average(hdxm, **kwargs)
+    elif method == 'wt_avg_vectorized':
+        result = fit_rates_weighted_average_vectorized(hdxm, **kwargs)
     else:
         raise ValueError(f"Invalid value for 'method': {method}")
 
@@ -240,18 +466,142 @@ def fit_kinetics(t, d, model, chisq_thd=100):
         return er
 
     model.initial_guess(t, d)
+    sf_model = model.bind()
     with temporary_seed(43):
-        fit = Fit(model.sf_model, t, d, minimizer=Powell)
+        fit = Fit(sf_model, t, d, minimizer=Powell)
         res = fit.execute()
 
         if not check_bounds(res) or np.any(np.isnan(list(res.params.values()))) or res.chi_squared > chisq_thd:
-            fit = Fit(model.sf_model, t, d, minimizer=DifferentialEvolution)
+            fit = Fit(sf_model, t, d, minimizer=DifferentialEvolution)
             #grid = model.initial_grid(t, d, step=5)
             res = fit.execute()
 
     return res
 
 
+def fit_kinetics_vectorized(t, d, bounds, model_type='association', max_iter=100, num_starts=5, callback=None):
+    """
+    Fit two-component kinetics to a set of uptake curves simultaneously by vectorized Levenberg-Marquardt optimization.
+
+    Rate constants are optimized in logarithmic space and are constrained to `bounds` by a logistic transformation, as
+    is the relative amplitude `r`. Optimization is started from initial guesses estimated from the data as well as from
+    a grid of starting values, and for each curve the result with the lowest chi squared is returned.
+
+    Parameters
+    ----------
+    t : :class:`~numpy.ndarray`
+        Array of time points (shape Nt)
+    d : :class:`~numpy.ndarray`
+        Array of uptake values (shape N x Nt)
+    bounds : :obj:`tuple`
+        Lower and upper bounds of the rate constants
+    model_type : :obj:`str`
+        Either 'association' or 'dissociation'
+    max_iter : :obj:`int`
+        Maximum number of iterations
+    num_starts : :obj:`int`
+        Number of rate constant values per axis of the grid of starting values.
+    callback : :obj:`callable`, optional
+        Called every iteration with arguments iteration, `max_iter` and the chi squared values of the best starting
+        values. Optimization is stopped if the callback returns `True`. See :class:`~pyhdx.fitting.FitProgress`.
+
+    Returns
+    -------
+    values : :class:`~numpy.ndarray`
+        Array of fitted values of `k1`, `k2` and `r` (shape N x 3)
+    chi_squared : :class:`~numpy.ndarray`
+        Array of chi squared values (shape N)
+
+    """
+    if model_type == 'association':
+        y = np.asarray(d, dtype=float)
+    elif model_type == 'dissociation':
+        y = 1 - np.asarray(d, dtype=float)  # Dissociation model equals one minus the association model
+    else:
+        raise ValueError('Invalid model type {}'.format(model_type))
+
+    t = np.asarray(t, dtype=float)
+    N = len(y)
+    y_start = y[:, np.newaxis, :]  # Data broadcast along the starting values axis
+    log_lower, log_upper = np.log(bounds[0]), np.log(bounds[1])
+
+    def to_values(theta):
+        s = 1 / (1 + np.exp(-theta))
+        k = np.exp(log_lower + (log_upper - log_lower) * s[..., :2])
+        return k, s
+
+    def to_theta(k1, k2, r):
+        eps = 1e-6
+        s_k = (np.log(np.stack([k1, k2], axis=-1)) - log_lower) / (log_upper - log_lower)
+        s = np.concatenate([s_k, np.asarray(r)[..., np.newaxis]], axis=-1)
+        s = np.clip(s, eps, 1 - eps)
+        return np.log(s / (1 - s))
+
+    def evaluate(theta):
+        k, s = to_values(theta)
+        r = s[..., 2:3]
+        e1 = np.exp(-k[..., 0:1] * t)
+        e2 = np.exp(-k[..., 1:2] * t)
+        residuals = 1 - (r * e1 + (1 - r) * e2) - y_start
+        # Jacobian wrt theta, shape (..., Nt, 3)
+        dk = (log_upper - log_lower) * s[..., :2] * (1 - s[..., :2]) * k
+        jac = np.stack([r * t * e1 * dk[..., 0:1],
+                        (1 - r) * t * e2 * dk[..., 1:2],
+                        (e2 - e1) * s[..., 2:3] * (1 - s[..., 2:3])], axis=-1)
+        return residuals, jac
+
+    # Initial guesses estimated from the data, vectorized version of `TwoComponentAssociationModel.initial_guess`
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k1_guess = -np.log(np.clip(1 - y[:, 2], 1e-6, 1)) / t[2]
+        arg = np.clip(2 * (1 - y[:, -2]) - np.exp(-k1_guess * t[-2]), 1e-6, 1)
+        k2_guess = -np.log(arg) / t[-2]
+    k_guess = np.clip(np.stack([k1_guess, k2_guess]), bounds[0], bounds[1])
+    starts = [to_theta(k_guess[0], k_guess[1], np.full(N, 0.5))]
+
+    # Grid of starting values with k1 > k2
+    k_space = np.exp(np.linspace(log_lower, log_upper, num=num_starts + 2)[1:-1])
+    for i, k1 in enumerate(k_space):
+        for k2 in k_space[:i]:
+            for r in [0.25, 0.75]:
+                starts.append(np.tile(to_theta(k1, k2, r), (N, 1)))
+
+    theta = np.stack(starts, axis=1)  # shape N x num_starts x 3
+
+    residuals, jac = evaluate(theta)
+    chi_squared = np.sum(residuals**2, axis=-1)
+    damping = np.full(chi_squared.shape, 1e-3)
+    for i in range(max_iter):
+        JtJ = np.einsum('...ti,...tj->...ij', jac, jac)
+        Jtr = np.einsum('...ti,...t->...i', jac, residuals)
+        A = JtJ + damping[..., np.newaxis, np.newaxis] * (JtJ * np.eye(3) + 1e-12 * np.eye(3))
+        step = np.linalg.solve(A, -Jtr[..., np.newaxis])[..., 0]
+
+        new_theta = theta + step
+        new_residuals, new_jac = evaluate(new_theta)
+        new_chi_squared = np.sum(new_residuals**2, axis=-1)
+
+        improved = new_chi_squared < chi_squared
+        small_step = improved & (chi_squared - new_chi_squared <= 1e-10 * chi_squared)
+
+        theta = np.where(improved[..., np.newaxis], new_theta, theta)
+        residuals = np.where(improved[..., np.newaxis], new_residuals, residuals)
+        jac = np.where(improved[..., np.newaxis, np.newaxis], new_jac, jac)
+        chi_squared = np.where(improved, new_chi_squared, chi_squared)
+        damping = np.where(improved, damping / 10, damping * 10)
+
+        if np.all(small_step | (damping > 1e10)):
+            break
+        if callback is not None and callback(i, max_iter, np.min(chi_squared, axis=1)):
+            break
+
+    best = np.argmin(chi_squared, axis=1)
+    theta_best = theta[np.arange(N), best]
+    k, s = to_values(theta_best)
+    values = np.column_stack([k, s[:, 2]])
+
+    return values, chi_squared[np.arange(N), best]
+
+
 def check_bounds(fit_result):
     """ Check if the obtained fit result is within bounds"""
     for param in fit_result.model.params:
@@ -280,11 +630,18 @@ optimizer_defaults = {
         'momentum': 0.5,
         'nesterov': True
     },
+    'LBFGS': {
+        'lr': 1,
+        'max_iter': 20,
+        'history_size': 50,
+        'line_search_fn': 'strong_wolfe'
+    },
 }
 
 
 def run_optimizer(inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, regularizer,
-                  epochs=100000, patience=50, stop_loss=0.05):
+                  epochs=100000, patience=50, stop_loss=0.05, optimizer_state=None, compile=False,
+                  freeze_converged=False, chunk_size=None, callback=None):
     """
 
     Runs optimization/fitting of PyTorch model.
@@ -296,65 +653,234 @@ def run_optimizer(inputs, output_data, optimizer_klass, optimizer_kwargs, model,
     output_data : :class:`~torch.Tensor`
         comparison data to model output
     optimizer_klass : :mod:`~torch.optim`
+        Optimizer class. Both first-order optimizers (ie SGD) and optimizers which reevaluate the loss multiple times
+        per step (ie LBFGS) are supported.
     optimizer_kwargs : :obj:`dict`
         kwargs to pass to pytorch optimizer
     model : :class:`~torch.nn.Module`
         pytorch model
     criterion: callable
-        loss function
+        loss function. Can return either a scalar or a vector of losses for independent fits stacked along the first
+        axis.
     regularizer callable
-        regularizer function
+        regularizer function. Returned shape must match the output of `criterion`.
     epochs : :obj:`int`
         Max number of epochs
     patience : :obj:`int`
         Number of epochs with less progress than `stop_loss` before terminating optimization
     stop_loss : :obj:`float`
-        Threshold of optimization value below which no progress is made
+        Threshold of optimization value below which no progress is made. For vector losses optimization is terminated
+        when all elements make no progress.
+    optimizer_state : :obj:`dict`, optional
+        State dict of a previous optimizer of the same type and parameter shape, to continue a previous optimization.
+    compile : :obj:`bool`
+        If `True`, the loss function is compiled with :func:`torch.compile` (requires PyTorch 2.0 or later).
+        Compilation takes considerable time and only pays off for long fits. Not supported in combination with
+        `chunk_size`.
+    freeze_converged : :obj:`bool`
+        Only applies to vector losses. If `True`, the termination criterion is applied to each element of the loss
+        separately, and the corresponding entries along the first axis of the model parameters are frozen once an
+        element has converged. Optimization is terminated when all elements have converged. Losses of converged
+        elements are NaN in the returned loss history after the epoch they converged.
+    chunk_size : :obj:`int`, optional
+        If given, the loss is evaluated in chunks of `chunk_size` peptides and gradients are accumulated over chunks,
+        which bounds the memory of intermediate results and autograd buffers. The model must compute its output
+        as `coverage_matmul(X, model.uptake(temperature, k_int, timepoints), packed=model.packed)`, ie
+        :class:`~pyhdx.fitting_torch.DeltaGFit`, and `criterion` must be a sum over peptides.
+    callback : :obj:`callable`, optional
+        Called after every epoch with arguments epoch, `epochs` and the current total loss. Optimization is stopped if
+        the callback returns `True`. See :class:`~pyhdx.fitting.FitProgress`.
 
     Returns
     -------
+    mse_loss : :class:`~numpy.ndarray`
+        Array with mean squared error losses per epoch
+    total_loss : :class:`~numpy.ndarray`
+        Array with total losses per epoch
+    model : :class:`~torch.nn.Module`
+        The optimized pytorch model
+    optimizer_state : :obj:`dict`
+        State dict of the optimizer at the end of optimization
 
     """
 
     optimizer_obj = optimizer_klass(model.parameters(), **optimizer_kwargs)
+    if optimizer_state is not None:
+        optimizer_obj.load_state_dict(optimizer_state)
 
     np.random.seed(43)
     torch.manual_seed(43)
 
-    mse_loss_list = [np.inf]
-    total_loss_list = [np.inf]
-
-    def closure():
+    def loss_func():
         output = model(*inputs)
         loss = criterion(output, output_data)
-        mse_loss_list.append(loss.detach())
-        reg_loss = regularizer(model.deltaG)
-        total_loss = loss + reg_loss
-        total_loss_list.append(total_loss.detach())
-        total_loss.backward()
-        return total_loss
-
-    stop = 0
-    for epoch in range(epochs):
+        total_loss = loss + regularizer(model.deltaG)
+        return loss, total_loss
+
+    if compile:
+        if chunk_size is not None:
+            raise ValueError("Compiling the loss function is not supported in combination with 'chunk_size'")
+        if not hasattr(torch, 'compile'):
+            raise ValueError("Compiling the loss function requires PyTorch 2.0 or later")
+        loss_func = torch.compile(loss_func)
+
+    def loss_backward():
+        loss, total_loss = loss_func()
+        total_loss.sum().backward()
+        return loss.detach(), total_loss.detach()
+
+    if chunk_size is not None:
+        temperature, X, k_int, timepoints = inputs
+        chunks = [(_select_peptides(X, i, chunk_size), output_data[..., i:i + chunk_size, :])
+                  for i in range(0, output_data.shape[-2], chunk_size)]
+
+        def loss_backward():
+            # Gradients of chunk losses are accumulated with respect to the (detached) residue uptake, which are then
+            # propagated to the parameters in one backward pass
+            uptake = model.uptake(temperature, k_int, timepoints)
+            uptake_leaf = uptake.detach().requires_grad_()
+            loss = 0
+            for X_chunk, data_chunk in chunks:
+                chunk_loss = criterion(coverage_matmul(X_chunk, uptake_leaf, packed=model.packed), data_chunk)
+                chunk_loss.sum().backward()
+                loss = loss + chunk_loss.detach()
+            reg_loss = regularizer(model.deltaG)
+            torch.autograd.backward([uptake, reg_loss.sum()], [uptake_leaf.grad, None])
+            return loss, loss + reg_loss.detach()
+
+    mse_loss_list = []
+    total_loss_list = []
+    current_losses = {}  # Losses of the most recent evaluation of the closure
+
+    def closure():
         optimizer_obj.zero_grad()
-        loss = optimizer_obj.step(closure)
+        current_losses['mse_loss'], current_losses['total_loss'] = loss_backward()
+        return current_losses['total_loss'].sum()
 
-        diff = total_loss_list[-2] - total_loss_list[-1]
-        if diff < stop_loss:
+    stop = 0  # Number of consecutive epochs without progress (tensor per element if freeze_converged)
+    previous_loss = np.inf
+    frozen = None  # Mask of converged elements, their parameters are restored to frozen_values after each step
+    for epoch in range(epochs):
+        optimizer_obj.step(closure)
+        total_loss = current_losses['total_loss']
+        mse_loss_list.append(current_losses['mse_loss'])
+        total_loss_list.append(total_loss)
+
+        if frozen is not None and frozen.any():
+            with torch.no_grad():
+                for par, values in zip(model.parameters(), frozen_values):
+                    par[frozen] = values[frozen]
+
+        diff = previous_loss - total_loss
+        previous_loss = total_loss
+        if freeze_converged:
+            stop = (stop + 1) * (diff < stop_loss).reshape(-1)
+            converged = stop > patience
+            if frozen is None:
+                frozen = torch.zeros_like(converged)
+                frozen_values = [par.detach().clone() for par in model.parameters()]
+                converged_epoch = torch.full(converged.shape, epochs)
+            new = converged & ~frozen
+            if new.any():
+                for par, values in zip(model.parameters(), frozen_values):
+                    values[new] = par.detach()[new]
+                converged_epoch[new] = epoch
+                frozen = frozen | converged
+            if frozen.all():
+                break
+        elif (diff < stop_loss).all():  # Vector losses make progress as long as any element makes progress
             stop += 1
             if stop > patience:
                 break
         else:
             stop = 0
 
+        if callback is not None and callback(epoch, epochs, total_loss.numpy()):
+            break
+
+    history = torch.stack([torch.stack(mse_loss_list), torch.stack(total_loss_list)], dim=1).numpy()
+    if frozen is not None:
+        flat_history = history.reshape(len(history), 2, -1)
+        for i, conv_epoch in enumerate(converged_epoch.tolist()):
+            flat_history[conv_epoch + 1:, :, i] = np.nan
     #par = model.deltaG.detach().numpy()
-    return np.array(mse_loss_list[1:]), np.array(total_loss_list[1:]), model
+    return history[:, 0], history[:, 1], model, optimizer_obj.state_dict()
+
+
+def _polish_fit(get_tensors, model, optimizer_klass, optimizer_kwargs, criterion, regularizer, mse_loss, total_loss,
+                epochs=1000, patience=50, stop_loss=0.05, chunk_size=None, callback=None):
+    """
+    Continue optimization of a model fitted in reduced precision in double precision.
+
+    Parameters
+    ----------
+    get_tensors : :obj:`callable`
+        Function returning the dictionary of input tensors, called with keyword argument `dtype`.
+    model : :class:`~torch.nn.Module`
+        Model to polish, parameters are converted to double precision in place.
+    mse_loss : :class:`~numpy.ndarray`
+        Mean squared error losses of the reduced precision optimization.
+    total_loss : :class:`~numpy.ndarray`
+        Total losses of the reduced precision optimization.
+
+    Other parameters are passed to :func:`~pyhdx.fitting.run_optimizer`.
+
+    Returns
+    -------
+    mse_loss, total_loss, model, optimizer_state
+        See :func:`~pyhdx.fitting.run_optimizer`, losses of both optimizations are concatenated.
+
+    """
+    tensors = get_tensors(dtype=torch.float64)
+    inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
+    model.double()
+
+    polish_mse, polish_total, model, optimizer_state = run_optimizer(
+        inputs, tensors['uptake'], optimizer_klass, optimizer_kwargs, model, criterion, regularizer, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, chunk_size=chunk_size, callback=callback)
+
+    mse_loss = np.concatenate([mse_loss.astype(float), polish_mse])
+    total_loss = np.concatenate([total_loss.astype(float), polish_total])
+
+    return mse_loss, total_loss, model, optimizer_state
+
+
+def _select_peptides(X, start, chunk_size):
+    """Returns the coverage matrix `X` (dense or sparse COO) of a chunk of peptides along its peptide axis"""
+    if X.is_sparse:
+        dim = X.dim() - 2
+        index = torch.arange(start, min(start + chunk_size, X.shape[dim]))
+        return X.index_select(dim, index).coalesce()
+    else:
+        return X[..., start:start + chunk_size, :]
+
+
+def _peptide_chunk_size(output_data, memory_budget):
+    """
+    Number of peptides per chunk such that intermediate results of chunked loss evaluation fit in `memory_budget`
+    (bytes). Per peptide, the model output, residuals and their gradients are stored for all timepoints (and states).
+    """
+    if memory_budget is None:
+        return None
+    bytes_per_peptide = 4 * output_data.element_size() * output_data.numel() // output_data.shape[-2]
+    return max(1, int(memory_budget // bytes_per_peptide))
 
 
 def regularizer_1d(r1, param):
     return r1 * torch.mean(torch.abs(param[:-1] - param[1:]))
 
 
+def regularizer_1d_path(r1, param):
+    #param shape: Nb x Nr x 1, r1 shape: Nb
+    return r1 * torch.mean(torch.abs(param[:, :-1, :] - param[:, 1:, :]), dim=(1, 2))
+
+
+def regularizer_1d_masked(r1, pair_mask, param):
+    #param shape: Ns x Nr x 1, pair_mask shape: Ns x (Nr - 1), True for pairs of neighbours both covered by state
+    d_ax1 = torch.abs(param[:, :-1, 0] - param[:, 1:, 0]) * pair_mask
+    return r1 * torch.sum(d_ax1, dim=1) / torch.sum(pair_mask, dim=1)
+
+
 def regularizer_2d_mean(r1, r2, param):
     #todo allow regularization wrt reference rather than mean
     #param shape: Ns x Nr x 1
@@ -372,31 +898,114 @@ def regularizer_2d_reference(r1, r2, param):
     return reg_loss
 
 
-def regularizer_2d_aligned(r1, r2, indices, param):
-    i0 = indices[0]
-    i1 = indices[1]
+def regularizer_2d_aligned(r1, r2, pairs, param):
+    #param shape: Ns x Nr x 1, pairs shape: 2 x Npairs, flat indices into param of aligned residue pairs
     d_ax1 = torch.abs(param[:, :-1, :] - param[:, 1:, :])
-    d_ax2 = torch.abs(param[0][i0] - param[1][i1])
+    flat = param.reshape(-1)
+    d_ax2 = torch.abs(flat[pairs[0]] - flat[pairs[1]])
 
     reg_loss = r1 * torch.mean(d_ax1) + r2 * torch.mean(d_ax2)
     return reg_loss
 
 
+def _warm_start_guess(fit_result, r_number, names):
+    """
+    Obtain initial guesses from a previous fit result. DeltaG values are taken from the previous result for residues
+    which were fitted previously, residues which are new in the coverage are linearly interpolated from neighbouring
+    residues, or take the value of the nearest residue when outside the previously fitted range.
+
+    Parameters
+    ----------
+    fit_result : :class:`~pyhdx.fitting_torch.TorchFitResult`
+        Previous fit result
+    r_number : :class:`~numpy.ndarray`
+        Residue numbers of the new fit
+    names : :obj:`list`
+        Names of the HDX measurements of the new fit. DeltaG values are matched to previous results by name. If not
+        all names are found, values are matched by position.
+
+    Returns
+    -------
+    initial_guess : :class:`~numpy.ndarray`
+        Array of initial guesses (shape Ns x Nr)
+
+    """
+    deltaG = fit_result.deltaG
+    if isinstance(deltaG, pd.Series):
+        deltaG = deltaG.to_frame()
+
+    if deltaG.shape[1] == 1 and len(names) == 1:
+        columns = list(deltaG.columns)
+    elif all(name in deltaG.columns for name in names):
+        columns = names
+    elif deltaG.shape[1] == len(names):
+        columns = list(deltaG.columns)
+    else:
+        raise ValueError("Cannot match the states of the previous fit result to the supplied HDX measurements")
+
+    guesses = []
+    for column in columns:
+        values = deltaG[column].dropna()
+        guesses.append(np.interp(r_number, values.index, values.to_numpy()))
+
+    return np.stack(guesses)
+
+
+def _warm_start_state(fit_result, optimizer, deltaG_shape):
+    """Returns the optimizer state of a previous fit result, or None if it cannot be used to continue optimization"""
+    state = fit_result.metadata.get('optimizer_state')
+    if state is None or fit_result.metadata.get('optimizer') != optimizer:
+        warnings.warn("No optimizer state of a previous fit with the same optimizer, starting with a new optimizer")
+        return None
+    elif tuple(next(fit_result.model.parameters()).shape) != tuple(deltaG_shape):
+        warnings.warn("Shape of deltaG parameters differs from the previous fit, starting with a new optimizer")
+        return None
+
+    return state
+
+
 def fit_gibbs_global(hdxm, initial_guess, r1=0.1, epochs=100000, patience=50, stop_loss=0.05,
-                     optimizer='SGD', **optimizer_kwargs):
+                     optimizer='SGD', sparse=False, reuse_optimizer_state=False, dtype=torch.float64,
+                     polish_epochs=1000, collapse_blocks=False, memory_budget=None, callback=None, **optimizer_kwargs):
     """
     Fit Gibbs free energies globally to all D-uptake data in the supplied hdxm
 
     Parameters
     ----------
     hdxm : :class:`~pyhdx.models.HDXMeasurement`
-    initial_guess : :class:`~pandas.Series` or :class:`~numpy.ndarray`
-        Gibbs free energy initial guesses (shape Nr)
+    initial_guess : :class:`~pandas.Series` or :class:`~numpy.ndarray` or :class:`~pyhdx.fitting_torch.TorchFitResult`
+        Gibbs free energy initial guesses (shape Nr), or a previous fit result to continue from. Residues which are
+        not in the previous result are interpolated.
     r1 : :obj:`float`
     epochs
     patience
     stop_loss
     optimizer : :obj:`str`
+        Name of the :mod:`~torch.optim` optimizer to use. Use 'LBFGS' for a quasi-Newton optimizer with line search,
+        which typically converges in tens to hundreds of epochs rather than tens of thousands.
+    sparse : :obj:`bool`
+        If `True`, the coverage matrix is used as a sparse tensor. Reduces memory and time per epoch for large proteins.
+    reuse_optimizer_state : :obj:`bool`
+        If `True` and `initial_guess` is a previous fit result with the same optimizer and number of residues, the
+        state of the previous optimizer (ie momentum or LBFGS history) is used to continue optimization.
+    dtype : :class:`~torch.dtype`
+        Floating point type used during optimization. Single precision (`torch.float32`) halves memory use and
+        increases throughput, at the cost of a less accurate minimum.
+    polish_epochs : :obj:`int`
+        If `dtype` is not `torch.float64`, optimization is continued in double precision for at most this number of
+        epochs after the reduced precision optimization terminates. Set to zero to skip polishing.
+    collapse_blocks : :obj:`bool`
+        If `True`, one deltaG value is fitted per block of contiguous residues with identical columns in the coverage
+        matrix (see :attr:`~pyhdx.models.Coverage.block_index`), which the D-uptake data can hardly distinguish. This
+        reduces the number of fitted parameters, but constrains deltaG to be constant within blocks. Initial guesses
+        are averaged per block.
+    memory_budget : :obj:`float`, optional
+        Memory budget in bytes for intermediate results of the loss evaluation. If given, the loss is evaluated in
+        chunks of peptides with accumulated gradients (see :func:`~pyhdx.fitting.run_optimizer`). Combine with
+        `sparse` to also reduce the memory of the coverage matrix.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
     optimizer_kwargs
 
     Returns
@@ -406,21 +1015,31 @@ def fit_gibbs_global(hdxm, initial_guess, r1=0.1, epochs=100000, patience=50, st
     #todo @tejas: Missing docstring
     """Pytorch global fitting"""
 
-    tensors = hdxm.get_tensors()
+    tensors = hdxm.get_tensors(sparse=sparse, dtype=dtype)
     inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
     output_data = tensors['uptake']
+    chunk_size = _peptide_chunk_size(output_data, memory_budget)
 
-    if isinstance(initial_guess, pd.Series):
+    block_index = hdxm.coverage.block_index if collapse_blocks else None
+    num_parameters = hdxm.Nr if block_index is None else block_index[-1] + 1
+
+    optimizer_state = None
+    if isinstance(initial_guess, TorchFitResult):
+        if reuse_optimizer_state:
+            optimizer_state = _warm_start_state(initial_guess, optimizer, (num_parameters, 1))
+        initial_guess = _warm_start_guess(initial_guess, hdxm.coverage.r_number, [hdxm.name])[0]
+    elif isinstance(initial_guess, pd.Series):
         initial_guess = initial_guess.to_numpy()
 
     assert len(initial_guess) == hdxm.Nr, "Invalid length of initial guesses"
 
-    #todo dtype config
-    dtype = torch.float64
-    deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=dtype).unsqueeze(-1))  #reshape (nr, 1)
-    #deltaG_par = torch.nn.Parameter(torch.Tensor(initial_guess).unsqueeze(-1))
-
-    model = DeltaGFit(deltaG_par)
+    if block_index is None:
+        deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=dtype).unsqueeze(-1))  #reshape (nr, 1)
+        model = DeltaGFit(deltaG_par)
+    else:
+        block_guess = np.bincount(block_index, weights=initial_guess) / np.bincount(block_index)
+        deltaG_par = torch.nn.Parameter(torch.tensor(block_guess, dtype=dtype).unsqueeze(-1))  # reshape (nb, 1)
+        model = BlockDeltaGFit(deltaG_par, block_index)
     criterion = torch.nn.MSELoss(reduction='sum')
 
     # Take default optimizer kwargs and update them with supplied kwargs
@@ -430,25 +1049,614 @@ def fit_gibbs_global(hdxm, initial_guess, r1=0.1, epochs=100000, patience=50, st
     reg_func = partial(regularizer_1d, r1)
 
     # returned_model is the same object as model
-    mse_loss, total_loss, returned_model = run_optimizer(inputs, output_data, optimizer_klass, optimizer_kwargs,
-                                                         model, criterion, reg_func, epochs=epochs,
-                                                         patience=patience, stop_loss=stop_loss)
+    mse_loss, total_loss, returned_model, optimizer_state = run_optimizer(
+        inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, reg_func, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, optimizer_state=optimizer_state,
+        chunk_size=chunk_size, callback=callback)
+
+    if dtype != torch.float64 and polish_epochs:
+        mse_loss, total_loss, returned_model, optimizer_state = _polish_fit(
+            partial(hdxm.get_tensors, sparse=sparse), model, optimizer_klass, optimizer_kwargs, criterion, reg_func,
+            mse_loss, total_loss, epochs=polish_epochs, patience=patience, stop_loss=stop_loss,
+            chunk_size=chunk_size, callback=callback)
 
     result = TorchSingleFitResult(hdxm, model,
-                                  mse_loss=mse_loss, total_loss=total_loss)
+                                  mse_loss=mse_loss, total_loss=total_loss, r1=r1,
+                                  optimizer=optimizer, optimizer_state=optimizer_state)
+
+    return result
+
+
+def _fit_gibbs_stacked(hdxm, initial_guess, r1_values, weights=None, epochs=100000, patience=50, stop_loss=0.05,
+                       optimizer='SGD', sparse=False, dtype=torch.float64, polish_epochs=1000, callback=None,
+                       **optimizer_kwargs):
+    """
+    Simultaneously fit a stack of independent fits to a single :class:`~pyhdx.models.HDXMeasurement`, sharing the
+    input tensors. Each fit has its own initial guess, value of `r1` and (optionally) weights of the squared errors.
+
+    Parameters
+    ----------
+    hdxm : :class:`~pyhdx.models.HDXMeasurement`
+    initial_guess : :class:`~numpy.ndarray`
+        Gibbs free energy initial guesses (shape Nb x Nr)
+    r1_values : :class:`~numpy.ndarray`
+        Values of the regularizer `r1` (shape Nb)
+    weights : :class:`~numpy.ndarray`, optional
+        Weights of squared errors per fit, broadcastable to shape (Nb x Np x Nt).
+    epochs
+    patience
+    stop_loss
+    optimizer : :obj:`str`
+    sparse : :obj:`bool`
+    dtype : :class:`~torch.dtype`
+    polish_epochs : :obj:`int`
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
+    optimizer_kwargs
+
+    Returns
+    -------
+    mse_loss, total_loss, model, optimizer_state
+        See :func:`~pyhdx.fitting.run_optimizer`. Losses have shape (N_epochs x Nb).
+
+    """
+    tensors = hdxm.get_tensors(sparse=sparse, dtype=dtype)
+    inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
+    output_data = tensors['uptake']
+
+    deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=dtype).unsqueeze(-1))
+    model = DeltaGFit(deltaG_par)
+
+    if weights is None:
+        def criterion(output, data):
+            return torch.sum((output - data)**2, dim=(-2, -1))  # MSE sum per fit
+    else:
+        weights_tensor = torch.tensor(weights, dtype=dtype)
+
+        def criterion(output, data):
+            return torch.sum(weights_tensor * (output - data)**2, dim=(-2, -1))
+
+    optimizer_kwargs = {**optimizer_defaults.get(optimizer, {}), **optimizer_kwargs}
+    optimizer_klass = getattr(torch.optim, optimizer)
+
+    reg_func = partial(regularizer_1d_path, torch.tensor(r1_values, dtype=dtype))
+
+    mse_loss, total_loss, model, optimizer_state = run_optimizer(
+        inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, reg_func, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, callback=callback)
+
+    if dtype != torch.float64 and polish_epochs:
+        mse_loss, total_loss, model, optimizer_state = _polish_fit(
+            partial(hdxm.get_tensors, sparse=sparse), model, optimizer_klass, optimizer_kwargs, criterion, reg_func,
+            mse_loss, total_loss, epochs=polish_epochs, patience=patience, stop_loss=stop_loss, callback=callback)
+
+    return mse_loss, total_loss, model, optimizer_state
+
+
+def fit_gibbs_regularization_path(hdxm, initial_guess, r1_values, epochs=100000, patience=50, stop_loss=0.05,
+                                  optimizer='SGD', sparse=False, dtype=torch.float64, polish_epochs=1000,
+                                  callback=None, **optimizer_kwargs):
+    """
+    Fit Gibbs free energies globally to all D-uptake data in the supplied hdxm for a series of values of the
+    regularizer `r1`.
+
+    All fits are stacked along the first axis of the deltaG parameter and optimized simultaneously in one optimization
+    loop. As losses of individual fits are independent, for first-order optimizers the result for each value of `r1` is
+    equal to the result of its separate fit, except that optimization continues until all fits are converged.
+
+    Parameters
+    ----------
+    hdxm : :class:`~pyhdx.models.HDXMeasurement`
+    initial_guess : :class:`~pandas.Series` or :class:`~numpy.ndarray`
+        Gibbs free energy initial guesses (shape Nr), used for all values of `r1`
+    r1_values : :obj:`iterable`
+        Values of the regularizer `r1` to fit
+    epochs
+    patience
+    stop_loss
+    optimizer : :obj:`str`
+    sparse : :obj:`bool`
+    dtype : :class:`~torch.dtype`
+        Floating point type used during optimization, see :func:`~pyhdx.fitting.fit_gibbs_global`.
+    polish_epochs : :obj:`int`
+        Maximum number of epochs of double precision polishing when `dtype` is not `torch.float64`.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
+    optimizer_kwargs
+
+    Returns
+    -------
+    result : :class:`~pyhdx.fitting_torch.TorchRegularizationPathResult`
+
+    """
+
+    if isinstance(initial_guess, pd.Series):
+        initial_guess = initial_guess.to_numpy()
+
+    assert len(initial_guess) == hdxm.Nr, "Invalid length of initial guesses"
+
+    r1_values = np.asarray(r1_values, dtype=float)
+    initial_guess = np.tile(initial_guess, (len(r1_values), 1))
+
+    mse_loss, total_loss, model, optimizer_state = _fit_gibbs_stacked(
+        hdxm, initial_guess, r1_values, epochs=epochs, patience=patience, stop_loss=stop_loss, optimizer=optimizer,
+        sparse=sparse, dtype=dtype, polish_epochs=polish_epochs, callback=callback,
+        **optimizer_kwargs)
+
+    result = TorchRegularizationPathResult(hdxm, model, mse_loss=mse_loss, total_loss=total_loss, r1=r1_values,
+                                           optimizer=optimizer, optimizer_state=optimizer_state)
 
     return result
 
 
+def _fit_gibbs_replicates(hdxm, initial_guess, r1, weights, **fit_kwargs):
+    """Fit a batch of replicates with weights `weights` (shape Nb x Np x Nt), returns deltaG (shape Nb x Nr)"""
+    initial_guess = np.tile(initial_guess, (len(weights), 1))
+    r1_values = np.full(len(weights), r1, dtype=float)
+    mse_loss, total_loss, model, optimizer_state = _fit_gibbs_stacked(hdxm, initial_guess, r1_values, weights=weights,
+                                                                      **fit_kwargs)
+
+    return model.deltaG.detach().numpy().squeeze(-1)
+
+
+def fit_gibbs_global_resampled(fit_result, method='bootstrap', num_samples=100, ci=0.95, seed=43, batch_size=25,
+                               client=None, **fit_kwargs):
+    """
+    Estimate confidence intervals of Gibbs free energies by refitting resampled data.
+
+    Resampling methods are:
+    'bootstrap': Peptides are resampled with replacement. Confidence intervals are percentiles of the replicate
+    deltaG values.
+    'jackknife': Leave-one-timepoint-out jackknife. Confidence intervals are calculated from the jackknife standard
+    error, assuming normally distributed deltaG values.
+
+    Resampling is implemented by weights of the squared errors of peptides or timepoints, such that all replicates
+    share the same input data. Replicates are warm-started from the deltaG values of `fit_result` and are fitted in
+    stacked batches of `batch_size`.
+
+    Parameters
+    ----------
+    fit_result : :class:`~pyhdx.fitting_torch.TorchSingleFitResult`
+        Result of :func:`~pyhdx.fitting.fit_gibbs_global` to estimate confidence intervals for.
+    method : :obj:`str`
+        Either 'bootstrap' or 'jackknife'
+    num_samples : :obj:`int`
+        Number of bootstrap replicates. For 'jackknife', the number of replicates is equal to the number of timepoints.
+    ci : :obj:`float`
+        Confidence level of the intervals
+    seed : :obj:`int`
+        Seed for the random generation of bootstrap replicates.
+    batch_size : :obj:`int`
+        Number of replicates fitted simultaneously per task.
+    client :
+        Controls delegation of fitting tasks to Dask clusters. Options are: `None`: Batches are fitted in the local
+        thread. :class: Dask Client : Uses the supplied Dask client to schedule fitting tasks. `worker_client`: The
+        function was ran by a Dask worker and the additional fitting tasks are scheduled on the same Cluster. The
+        :class:`~pyhdx.models.HDXMeasurement` is scattered to the cluster once and shared by all tasks.
+    fit_kwargs
+        Additional keyword arguments passed to the fits, ie `epochs`, `patience`, `stop_loss` or `optimizer`. The value
+        of `r1` is taken from `fit_result` unless specified.
+
+    Returns
+    -------
+    result : :class:`~pyhdx.fitting_torch.TorchResamplingResult`
+
+    """
+    hdxm = fit_result.data_obj
+    r1 = fit_kwargs.pop('r1', fit_result.metadata.get('r1'))
+    if r1 is None:
+        raise ValueError("Value of 'r1' not found in fit result metadata, please specify 'r1'")
+
+    if method == 'bootstrap':
+        rng = np.random.default_rng(seed)
+        counts = rng.multinomial(hdxm.Np, np.full(hdxm.Np, 1 / hdxm.Np), size=num_samples)
+        weights = counts[:, :, np.newaxis].astype(float)  # Shape Nb x Np x 1
+    elif method == 'jackknife':
+        weights = (1 - np.eye(hdxm.Nt))[:, np.newaxis, :]  # Shape Nt x 1 x Nt
+    else:
+        raise ValueError(f"Invalid value for 'method': {method}")
+
+    initial_guess = fit_result.deltaG.to_numpy()
+    batches = [weights[i:i + batch_size] for i in range(0, len(weights), batch_size)]
+
+    if client is None:
+        results = [_fit_gibbs_replicates(hdxm, initial_guess, r1, batch, **fit_kwargs) for batch in batches]
+    else:
+        def map_batches(client):
+            hdxm_future = client.scatter(hdxm, broadcast=True, hash=False)
+            futures = client.map(_fit_gibbs_replicates, [hdxm_future]*len(batches), [initial_guess]*len(batches),
+                                 [r1]*len(batches), batches, pure=False, **fit_kwargs)
+            return client.gather(futures)
+
+        if isinstance(client, Client):
+            results = map_batches(client)
+        elif client == 'worker_client':
+            with worker_client() as client:
+                results = map_batches(client)
+        else:
+            raise ValueError(f"Invalid value for 'client': {client}")
+
+    replicates = pd.DataFrame(np.concatenate(results).T, index=hdxm.coverage.index)
+    replicates.columns.name = 'replicate'
+
+    return TorchResamplingResult(fit_result, replicates, method=method, ci=ci)
+
+
+def _cross_validation_masks(valid, k, holdout, rng):
+    """Returns boolean masks of held-out data (shape k x Ns x Np x Nt) for `valid` data entries (shape Ns x Np x Nt)"""
+    masks = np.zeros((k,) + valid.shape, dtype=bool)
+    for state_valid, state_masks in zip(valid, masks.swapaxes(0, 1)):
+        if holdout == 'peptides':
+            indices = np.flatnonzero(state_valid.any(axis=1))
+        elif holdout == 'timepoints':
+            indices = np.flatnonzero(state_valid.any(axis=0))
+        else:
+            raise ValueError(f"Invalid value for 'holdout': {holdout}")
+
+        if len(indices) < k:
+            raise ValueError(f"Number of folds {k} is larger than the number of {holdout} ({len(indices)})")
+
+        for mask, group in zip(state_masks, np.array_split(rng.permutation(indices), k)):
+            if holdout == 'peptides':
+                mask[group, :] = True
+            else:
+                mask[:, group] = True
+
+    return masks & valid
+
+
+def _fit_gibbs_fold(data_obj, initial_guess, regularizers, test_mask, **fit_kwargs):
+    """
+    Fit with the data entries in `test_mask` held out for each row of `regularizers` (values of r1 or r1, r2), returns
+    the train and test mean squared errors (shape N x 2)
+    """
+    if isinstance(data_obj, HDXMeasurementSet):
+        weights = (data_obj.masks['spt'] & ~test_mask).astype(float)
+        deltaG = [fit_gibbs_global_batch(data_obj, initial_guess, r1=r1, r2=r2, weights=weights, **fit_kwargs).model.deltaG
+                  for r1, r2 in regularizers]
+        deltaG = torch.stack(deltaG)
+    else:
+        weights = (~test_mask).astype(float)
+        r1_values = regularizers[:, 0]
+        mse_loss, total_loss, model, optimizer_state = _fit_gibbs_stacked(
+            data_obj, np.tile(initial_guess, (len(r1_values), 1)), r1_values, weights=weights, **fit_kwargs)
+        deltaG = model.deltaG
+
+    tensors = data_obj.get_tensors()
+    inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
+    with torch.no_grad():
+        output = DeltaGFit(deltaG.double())(*inputs).numpy()
+    sq_errors = (output - tensors['uptake'].numpy())**2
+    axes = tuple(range(1, sq_errors.ndim))
+
+    train_mse = np.sum(sq_errors * weights, axis=axes) / np.sum(weights)
+    test_mse = np.sum(sq_errors * test_mask, axis=axes) / np.sum(test_mask)
+
+    return np.stack([train_mse, test_mse], axis=1)
+
+
+def fit_gibbs_cross_validation(data_obj, initial_guess, r1_values, r2_values=None, k=5, holdout='peptides', seed=43,
+                               client=None, **fit_kwargs):
+    """
+    Select values of the regularizers by k-fold cross-validation.
+
+    The data is split in `k` folds by peptides or timepoints. For each fold and each value of the regularizer(s), the
+    data is fitted with the fold held out and the mean squared error of the held-out data is calculated. Held-out data
+    is excluded from the fit by zero weights of its squared errors, such that all fits share the same input data.
+
+    For a :class:`~pyhdx.models.HDXMeasurement`, fits of all values of `r1` of one fold are stacked and optimized
+    simultaneously (see :func:`~pyhdx.fitting.fit_gibbs_regularization_path`). For a
+    :class:`~pyhdx.models.HDXMeasurementSet`, all combinations of `r1_values` and `r2_values` are fitted with
+    :func:`~pyhdx.fitting.fit_gibbs_global_batch`, and peptides or timepoints of each state are split independently.
+
+    Parameters
+    ----------
+    data_obj : :class:`~pyhdx.models.HDXMeasurement` or :class:`~pyhdx.models.HDXMeasurementSet`
+    initial_guess : :class:`~pandas.Series` or :class:`~numpy.ndarray`
+        Gibbs free energy initial guesses (shape Nr, or Ns x Nr for a :class:`~pyhdx.models.HDXMeasurementSet`)
+    r1_values : :obj:`iterable`
+        Values of the regularizer `r1` to cross-validate.
+    r2_values : :obj:`iterable`, optional
+        Values of the regularizer `r2` to cross-validate, required for a :class:`~pyhdx.models.HDXMeasurementSet`.
+    k : :obj:`int`
+        Number of folds.
+    holdout : :obj:`str`
+        Either 'peptides' or 'timepoints'.
+    seed : :obj:`int`
+        Seed for the random assignment of peptides or timepoints to folds.
+    client :
+        Controls delegation of fitting tasks to Dask clusters. Options are: `None`: Folds are fitted in the local
+        thread. :class: Dask Client : Uses the supplied Dask client to schedule fitting tasks. `worker_client`: The
+        function was ran by a Dask worker and the additional fitting tasks are scheduled on the same Cluster. The
+        data is scattered to the cluster once and shared by all tasks.
+    fit_kwargs
+        Additional keyword arguments passed to the fits, ie `epochs`, `patience`, `stop_loss` or `optimizer`.
+
+    Returns
+    -------
+    result : :class:`~pyhdx.fitting_torch.TorchCrossValidationResult`
+
+    """
+    if isinstance(initial_guess, pd.Series):
+        initial_guess = initial_guess.to_numpy()
+
+    rng = np.random.default_rng(seed)
+    if isinstance(data_obj, HDXMeasurementSet):
+        if r2_values is None:
+            raise ValueError("Values of 'r2' are required for cross-validation of a HDXMeasurementSet")
+        names = ['r1', 'r2']
+        grid = np.array(list(product(r1_values, r2_values)), dtype=float)
+        test_masks = _cross_validation_masks(data_obj.masks['spt'], k, holdout, rng)
+        tasks = [(fold, grid[[i]]) for fold in range(k) for i in range(len(grid))]
+    else:
+        names = ['r1']
+        grid = np.asarray(r1_values, dtype=float)[:, np.newaxis]
+        test_masks = _cross_validation_masks(np.ones((1, data_obj.Np, data_obj.Nt), dtype=bool), k, holdout, rng)
+        test_masks = test_masks[:, 0]
+        tasks = [(fold, grid) for fold in range(k)]
+
+    folds, regularizers = zip(*tasks)
+    masks = [test_masks[fold] for fold in folds]
+
+    if client is None:
+        results = [_fit_gibbs_fold(data_obj, initial_guess, regs, mask, **fit_kwargs)
+                   for regs, mask in zip(regularizers, masks)]
+    else:
+        def map_folds(client):
+            data_future = client.scatter(data_obj, broadcast=True, hash=False)
+            futures = client.map(_fit_gibbs_fold, [data_future]*len(tasks), [initial_guess]*len(tasks),
+                                 regularizers, masks, pure=False, **fit_kwargs)
+            return client.gather(futures)
+
+        if isinstance(client, Client):
+            results = map_folds(client)
+        elif client == 'worker_client':
+            with worker_client() as client:
+                results = map_folds(client)
+        else:
+            raise ValueError(f"Invalid value for 'client': {client}")
+
+    dfs = []
+    for fold, regs, mse in zip(folds, regularizers, results):
+        df = pd.DataFrame(regs, columns=names)
+        df.insert(0, 'fold', fold)
+        df['train_mse'], df['test_mse'] = mse.T
+        dfs.append(df)
+    scores = pd.concat(dfs, ignore_index=True)
+
+    return TorchCrossValidationResult(data_obj, scores, holdout=holdout)
+
+
+def gibbs_loss_gradient(deltaG, X, k_int, timepoints, temperature, uptake, r1=0., hessian=False):
+    """
+    Calculates the loss of a Gibbs free energy fit and its gradient analytically, without autograd.
+
+    The loss is the sum of squared residuals of the D-uptake plus the `r1` regularization term of
+    :func:`~pyhdx.fitting.regularizer_1d`, equal to the loss minimized by :func:`~pyhdx.fitting.fit_gibbs_global`.
+    With U' the derivative of the D-uptake per residue (shape Nr x Nt) with respect to deltaG and residuals
+    R = X U - D, the gradient of the squared residuals is 2 Σ_t (XᵀR) ⊙ U'.
+
+    Parameters
+    ----------
+    deltaG : :class:`~numpy.ndarray`
+        Gibbs free energies (shape Nr)
+    X : :class:`~numpy.ndarray` or :class:`~scipy.sparse.csr_matrix`
+        Coverage matrix (shape Np x Nr)
+    k_int : :class:`~numpy.ndarray`
+        Intrinsic rates of exchange (shape Nr)
+    timepoints : :class:`~numpy.ndarray`
+        Exposure times (shape Nt)
+    temperature : :obj:`float`
+    uptake : :class:`~numpy.ndarray`
+        Measured D-uptake (shape Np x Nt)
+    r1 : :obj:`float`
+        Value of the regularizer
+    hessian : :obj:`bool`
+        If `True`, the Gauss-Newton approximation of the Hessian of the squared residuals, 2 (XᵀX) ⊙ (U'U'ᵀ), is also
+        returned (shape Nr x Nr). The regularizer does not contribute to the Hessian.
+
+    Returns
+    -------
+    mse_loss : :obj:`float`
+        Sum of squared residuals
+    total_loss : :obj:`float`
+        Sum of squared residuals and regularization loss
+    gradient : :class:`~numpy.ndarray`
+        Gradient of the total loss (shape Nr)
+    hessian : :class:`~numpy.ndarray`
+        Gauss-Newton Hessian, only returned if `hessian` is `True`
+
+    """
+    pfact = np.exp(deltaG / (constants.R * temperature))
+    k_obs = k_int / (1 + pfact)
+    exp_kt = np.exp(-np.outer(k_obs, timepoints))
+    residuals = X @ (1 - exp_kt) - uptake
+
+    # Derivative of uptake wrt deltaG: dU/dk_obs * dk_obs/ddeltaG
+    dk_obs = -k_obs * pfact / (1 + pfact) / (constants.R * temperature)
+    d_uptake = exp_kt * timepoints[np.newaxis, :] * dk_obs[:, np.newaxis]
+
+    mse_loss = np.sum(residuals**2)
+    gradient = 2 * np.sum((X.T @ residuals) * d_uptake, axis=1)
+
+    diffs = deltaG[:-1] - deltaG[1:]
+    total_loss = mse_loss + r1 * np.mean(np.abs(diffs))
+    reg_grad = r1 * np.sign(diffs) / len(diffs)
+    gradient[:-1] += reg_grad
+    gradient[1:] -= reg_grad
+
+    if hessian:
+        XtX = X.T @ X
+        XtX = XtX.toarray() if hasattr(XtX, 'toarray') else XtX
+        return mse_loss, total_loss, gradient, 2 * XtX * (d_uptake @ d_uptake.T)
+    else:
+        return mse_loss, total_loss, gradient
+
+
+def fit_gibbs_global_scipy(hdxm, initial_guess, r1=0.1, method='L-BFGS-B', max_iter=10000, tol=None,
+                           callback=None, **minimizer_kwargs):
+    """
+    Fit Gibbs free energies globally to all D-uptake data in the supplied hdxm with a SciPy minimizer, using
+    analytically calculated gradients (see :func:`~pyhdx.fitting.gibbs_loss_gradient`) instead of PyTorch autograd.
+
+    The loss function is equal to that of :func:`~pyhdx.fitting.fit_gibbs_global`. The regularization term is not
+    differentiable where neighbouring deltaG values are equal, which quasi-Newton minimizers handle by their line
+    search, resulting in losses comparable to the PyTorch 'LBFGS' optimizer.
+
+    Parameters
+    ----------
+    hdxm : :class:`~pyhdx.models.HDXMeasurement`
+    initial_guess : :class:`~pandas.Series` or :class:`~numpy.ndarray`
+        Gibbs free energy initial guesses (shape Nr)
+    r1 : :obj:`float`
+    method : :obj:`str`
+        Name of the :func:`~scipy.optimize.minimize` method. For methods which accept a Hessian ('Newton-CG',
+        'trust-ncg', 'trust-krylov', 'trust-exact', 'trust-constr'), the Gauss-Newton Hessian is supplied.
+    max_iter : :obj:`int`
+        Maximum number of iterations (function evaluations for 'TNC').
+    tol : :obj:`float`, optional
+        Tolerance for termination, passed to :func:`~scipy.optimize.minimize`.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
+    minimizer_kwargs
+        Additional options passed to the minimizer.
+
+    Returns
+    -------
+    result : :class:`~pyhdx.fitting_torch.TorchSingleFitResult`
+
+    """
+    if isinstance(initial_guess, pd.Series):
+        initial_guess = initial_guess.to_numpy()
+
+    assert len(initial_guess) == hdxm.Nr, "Invalid length of initial guesses"
+
+    args = (hdxm.coverage.X_sparse, hdxm.coverage['k_int'].to_numpy(), hdxm.timepoints, hdxm.temperature,
+            hdxm.uptake_corrected.T, r1)
+    losses = [gibbs_loss_gradient(initial_guess, *args)[:2]]
+
+    def fun(deltaG):
+        mse_loss, total_loss, gradient = gibbs_loss_gradient(deltaG, *args)
+        return total_loss, gradient
+
+    current = {'x': initial_guess}
+
+    def iteration_callback(intermediate_result):
+        # TNC (and SciPy < 1.11) pass the current parameter vector instead of an OptimizeResult
+        current['x'] = np.array(getattr(intermediate_result, 'x', intermediate_result))
+        mse_loss, total_loss, gradient = gibbs_loss_gradient(current['x'], *args)
+        losses.append((mse_loss, total_loss))
+        if callback is not None and callback(len(losses) - 1, max_iter, total_loss):
+            raise StopIteration
+
+    hess = None
+    if method.lower() in ['newton-cg', 'trust-ncg', 'trust-krylov', 'trust-exact', 'trust-constr']:
+        hess = lambda deltaG: gibbs_loss_gradient(deltaG, *args, hessian=True)[-1]
+
+    options = {'maxfun' if method.lower() == 'tnc' else 'maxiter': max_iter, **minimizer_kwargs}
+    try:
+        result = minimize(fun, initial_guess, jac=True, hess=hess, method=method, tol=tol, callback=iteration_callback,
+                          options=options)
+        deltaG, message = result.x, result.message
+    except StopIteration:  # Raised through minimize by TNC and by all methods in SciPy < 1.11
+        deltaG, message = current['x'], 'Stopped by callback'
+
+    losses = np.array(losses).reshape(-1, 2)
+    deltaG_par = torch.nn.Parameter(torch.tensor(deltaG, dtype=torch.float64).unsqueeze(-1))
+    fit_result = TorchSingleFitResult(hdxm, DeltaGFit(deltaG_par), mse_loss=losses[:, 0], total_loss=losses[:, 1],
+                                      r1=r1, optimizer=method, optimizer_state=None, message=message)
+
+    return fit_result
+
+
+def fit_gibbs_global_multi(hdx_set, initial_guess, r1=0.1, epochs=100000, patience=50, stop_loss=0.05,
+                           optimizer='SGD', callback=None, **optimizer_kwargs):
+    """
+    Fit Gibbs free energies to multiple HDX measurements independently, without coupling between measurements.
+
+    All measurements are fitted simultaneously as one batch in the packed representation (see
+    :meth:`~pyhdx.models.HDXMeasurementSet.get_tensors`). Convergence is determined per measurement and converged
+    measurements are frozen, such that for first-order optimizers results are equal to separate fits with
+    :func:`~pyhdx.fitting.fit_gibbs_global`.
+
+    Parameters
+    ----------
+    hdx_set : :class:`~pyhdx.models.HDXMeasurementSet`
+    initial_guess : :class:`~numpy.ndarray`
+        Gibbs free energy initial guesses (shape Ns x Nr)
+    r1 : :obj:`float`
+    epochs
+    patience
+    stop_loss
+    optimizer : :obj:`str`
+        Name of the :mod:`~torch.optim` optimizer to use. For 'LBFGS', frozen measurements affect the quasi-Newton
+        updates of the others and results are not equal to separate fits.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
+    optimizer_kwargs
+
+    Returns
+    -------
+    results : :obj:`list`
+        List of :class:`~pyhdx.fitting_torch.TorchSingleFitResult`, one per HDX measurement. The optimizer state is
+        not included in the fit results.
+
+    """
+    tensors = hdx_set.get_tensors(packed=True)
+    inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
+    output_data = tensors['uptake']
+
+    assert initial_guess.shape == (hdx_set.Ns, hdx_set.Nr), "Invalid shape of initial guesses"
+
+    deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=torch.float64).reshape(hdx_set.Ns, hdx_set.Nr, 1))
+    model = DeltaGFit(deltaG_par, packed=True)
+
+    # Index of the measurement of each peptide in the packed uptake tensor
+    sample_index = torch.tensor(np.repeat(np.arange(hdx_set.Ns), [hdxm.Np for hdxm in hdx_set]))
+
+    def criterion(output, data):
+        sq_errors = torch.sum((output - data)**2, dim=-1)
+        return torch.zeros(hdx_set.Ns, dtype=sq_errors.dtype).index_add(0, sample_index, sq_errors)  # MSE sum per state
+
+    mask = hdx_set.masks['sr']
+    pair_mask = torch.tensor(mask[:, :-1] & mask[:, 1:])
+    reg_func = partial(regularizer_1d_masked, r1, pair_mask)
+
+    optimizer_kwargs = {**optimizer_defaults.get(optimizer, {}), **optimizer_kwargs}
+    optimizer_klass = getattr(torch.optim, optimizer)
+
+    mse_loss, total_loss, model, optimizer_state = run_optimizer(
+        inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, reg_func, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, freeze_converged=True, callback=callback)
+
+    results = []
+    for i, hdxm in enumerate(hdx_set):
+        deltaG = model.deltaG.detach()[i][mask[i]].clone()
+        losses = {'mse_loss': mse_loss[:, i], 'total_loss': total_loss[:, i]}
+        losses = {k: v[~np.isnan(v)] for k, v in losses.items()}
+        result = TorchSingleFitResult(hdxm, DeltaGFit(torch.nn.Parameter(deltaG)), r1=r1, optimizer=optimizer,
+                                      optimizer_state=None, **losses)
+        results.append(result)
+
+    return results
+
+
 def fit_gibbs_global_batch(hdx_set, initial_guess, r1=2, r2=5, r2_reference=False, epochs=100000, patience=50, stop_loss=0.05,
-               optimizer='SGD', **optimizer_kwargs):
+               optimizer='SGD', sparse=False, packed=False, reuse_optimizer_state=False, dtype=torch.float64,
+               polish_epochs=1000, memory_budget=None, weights=None, callback=None, **optimizer_kwargs):
     """
     Batch fit gibbs free energies to multiple HDX measurements
 
     Parameters
     ----------
     hdx_set : :class:`~pyhdx.models.HDXMeasurementSet`
-    initial_guess
+    initial_guess : :class:`~numpy.ndarray` or :class:`~pyhdx.fitting_torch.TorchFitResult`
+        Gibbs free energy initial guesses (shape Ns x Nr), or a previous fit result to continue from. States are
+        matched by name, residues which are not in the previous result are interpolated.
     r1
     r2
     r2_reference=False,
@@ -456,25 +1664,66 @@ def fit_gibbs_global_batch(hdx_set, initial_guess, r1=2, r2=5, r2_reference=Fals
     epochs
     patience
     stop_loss
-    optimizer
+    optimizer : :obj:`str`
+        Name of the :mod:`~torch.optim` optimizer to use, ie 'SGD' or 'LBFGS'.
+    sparse : :obj:`bool`
+        If `True`, the coverage matrix is used as a sparse tensor. Reduces memory and time per epoch for large proteins.
+    packed : :obj:`bool`
+        If `True`, peptides of all states are concatenated in a sparse packed coverage matrix instead of padding all
+        states to the largest number of peptides (see :meth:`~pyhdx.models.HDXMeasurementSet.get_tensors`). Reduces
+        memory and time per epoch when the numbers of peptides differ between states.
+    reuse_optimizer_state : :obj:`bool`
+        If `True` and `initial_guess` is a previous fit result with the same optimizer and shape, the state of the
+        previous optimizer is used to continue optimization.
+    dtype : :class:`~torch.dtype`
+        Floating point type used during optimization. Single precision (`torch.float32`) halves memory use and
+        increases throughput, at the cost of a less accurate minimum.
+    polish_epochs : :obj:`int`
+        If `dtype` is not `torch.float64`, optimization is continued in double precision for at most this number of
+        epochs after the reduced precision optimization terminates. Set to zero to skip polishing.
+    memory_budget : :obj:`float`, optional
+        Memory budget in bytes for intermediate results of the loss evaluation. If given, the loss is evaluated in
+        chunks of peptides with accumulated gradients (see :func:`~pyhdx.fitting.run_optimizer`). Combine with
+        `sparse` to also reduce the memory of the coverage matrix.
+    weights : :class:`~numpy.ndarray`, optional
+        Weights of squared errors, broadcastable to the padded uptake shape (Ns x Np x Nt). Not supported in
+        combination with `packed` or `memory_budget`.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
     optimizer_kwargs
 
     Returns
     -------
 
     """
+    if weights is not None and (packed or memory_budget is not None):
+        raise ValueError("Weights are not supported in combination with 'packed' or 'memory_budget'")
+
     # todo still some repeated code with fit_gibbs single
-    tensors = hdx_set.get_tensors()
+    tensors = hdx_set.get_tensors(sparse=sparse, packed=packed, dtype=dtype)
     inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
     output_data = tensors['uptake']
+    chunk_size = _peptide_chunk_size(output_data, memory_budget)
+
+    optimizer_state = None
+    if isinstance(initial_guess, TorchFitResult):
+        if reuse_optimizer_state:
+            optimizer_state = _warm_start_state(initial_guess, optimizer, (hdx_set.Ns, hdx_set.Nr, 1))
+        initial_guess = _warm_start_guess(initial_guess, hdx_set.coverage.index.to_numpy(), hdx_set.names)
 
     assert initial_guess.shape == (hdx_set.Ns, hdx_set.Nr), "Invalid shape of initial guesses"
 
-    dtype = torch.float64
     deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=dtype).reshape(hdx_set.Ns, hdx_set.Nr, 1))
 
-    model = DeltaGFit(deltaG_par)
-    criterion = torch.nn.MSELoss(reduction='sum')
+    model = DeltaGFit(deltaG_par, packed=packed)
+    if weights is None:
+        criterion = torch.nn.MSELoss(reduction='sum')
+    else:
+        weights_tensor = torch.tensor(weights, dtype=dtype)
+
+        def criterion(output, data):
+            return torch.sum(weights_tensor * (output - data)**2)
 
     # Take default optimizer kwargs and update them with supplied kwargs
     optimizer_kwargs = {**optimizer_defaults.get(optimizer, {}), **optimizer_kwargs}  # Take defaults and override with user-specified
@@ -484,24 +1733,34 @@ def fit_gibbs_global_batch(hdx_set, initial_guess, r1=2, r2=5, r2_reference=Fals
         reg_func = partial(regularizer_2d_reference, r1, r2)
     else:
         reg_func = partial(regularizer_2d_mean, r1, r2)
-    mse_loss, total_loss, returned_model = run_optimizer(inputs, output_data, optimizer_klass, optimizer_kwargs,
-                                                         model, criterion, reg_func, epochs=epochs,
-                                                         patience=patience, stop_loss=stop_loss)
-
-    result = TorchBatchFitResult(hdx_set, model, mse_loss=mse_loss, total_loss=total_loss)
+    mse_loss, total_loss, returned_model, optimizer_state = run_optimizer(
+        inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, reg_func, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, optimizer_state=optimizer_state,
+        chunk_size=chunk_size, callback=callback)
+
+    if dtype != torch.float64 and polish_epochs:
+        mse_loss, total_loss, returned_model, optimizer_state = _polish_fit(
+            partial(hdx_set.get_tensors, sparse=sparse, packed=packed), model, optimizer_klass, optimizer_kwargs,
+            criterion, reg_func, mse_loss, total_loss, epochs=polish_epochs, patience=patience, stop_loss=stop_loss,
+            chunk_size=chunk_size, callback=callback)
+
+    result = TorchBatchFitResult(hdx_set, model, mse_loss=mse_loss, total_loss=total_loss,
+                                 optimizer=optimizer, optimizer_state=optimizer_state)
     return result
 
 
 def fit_gibbs_global_batch_aligned(hdx_set, initial_guess, r1=2, r2=5, epochs=100000, patience=50, stop_loss=0.05,
-               optimizer='SGD', **optimizer_kwargs):
+               optimizer='SGD', sparse=False, packed=False, dtype=torch.float64, polish_epochs=1000,
+               memory_budget=None, callback=None, **optimizer_kwargs):
     """
-    Batch fit gibbs free energies to two HDX measurements. The supplied HDXMeasurementSet must have alignment information
-    (supplied by HDXMeasurementSet.add_alignment)
+    Batch fit gibbs free energies to multiple aligned HDX measurements. The supplied HDXMeasurementSet must have
+    alignment information (supplied by HDXMeasurementSet.add_alignment). Differences in deltaG between aligned residues
+    are regularized with `r2` for the pairs of aligned residues in `HDXMeasurementSet.aligned_pairs`.
 
 
     Parameters
     ----------
-    hdx_set : :class:`~pyhdx.models.HDXMeasurement`
+    hdx_set : :class:`~pyhdx.models.HDXMeasurementSet`
     initial_guess
     r1
     r2
@@ -509,6 +1768,20 @@ def fit_gibbs_global_batch_aligned(hdx_set, initial_guess, r1=2, r2=5, epochs=10
     patience
     stop_loss
     optimizer
+    sparse : :obj:`bool`
+        If `True`, the coverage matrix is used as a sparse tensor.
+    packed : :obj:`bool`
+        If `True`, peptides of all states are concatenated in a sparse packed coverage matrix.
+    dtype : :class:`~torch.dtype`
+        Floating point type used during optimization, see :func:`~pyhdx.fitting.fit_gibbs_global_batch`.
+    polish_epochs : :obj:`int`
+        Maximum number of epochs of double precision polishing when `dtype` is not `torch.float64`.
+    memory_budget : :obj:`float`, optional
+        Memory budget in bytes for intermediate results of the loss evaluation, see
+        :func:`~pyhdx.fitting.fit_gibbs_global_batch`.
+    callback : :obj:`callable`, optional
+        Called with the progress of the fit, fitting is stopped when it returns `True`. See
+        :class:`~pyhdx.fitting.FitProgress`.
     optimizer_kwargs
 
     Returns
@@ -516,36 +1789,41 @@ def fit_gibbs_global_batch_aligned(hdx_set, initial_guess, r1=2, r2=5, epochs=10
 
     """
 
-    assert hdx_set.Ns == 2, 'Aligned batch fitting is limited to two states'
-
     #todo duplicate code
-    tensors = hdx_set.get_tensors()
+    tensors = hdx_set.get_tensors(sparse=sparse, packed=packed, dtype=dtype)
     inputs = [tensors[key] for key in ['temperature', 'X', 'k_int', 'timepoints']]
     output_data = tensors['uptake']
+    chunk_size = _peptide_chunk_size(output_data, memory_budget)
 
     assert initial_guess.shape == (hdx_set.Ns, hdx_set.Nr), "Invalid shape of initial guesses"
 
-    dtype = torch.float64
     deltaG_par = torch.nn.Parameter(torch.tensor(initial_guess, dtype=dtype).reshape(hdx_set.Ns, hdx_set.Nr, 1))
 
-    model = DeltaGFit(deltaG_par)
+    model = DeltaGFit(deltaG_par, packed=packed)
     criterion = torch.nn.MSELoss(reduction='sum')
 
     # Take default optimizer kwargs and update them with supplied kwargs
     optimizer_kwargs = {**optimizer_defaults.get(optimizer, {}), **optimizer_kwargs}  # Take defaults and override with user-specified
     optimizer_klass = getattr(torch.optim, optimizer)
 
-    if hdx_set.aligned_indices is None:
+    if hdx_set.aligned_pairs is None:
         raise ValueError("No alignment added to HDX measurements")
 
-    indices = [torch.tensor(i, dtype=torch.long) for i in hdx_set.aligned_indices]
+    pairs = torch.tensor(hdx_set.aligned_pairs, dtype=torch.long)
+
+    reg_func = partial(regularizer_2d_aligned, r1, r2, pairs)
+    mse_loss, total_loss, returned_model, optimizer_state = run_optimizer(
+        inputs, output_data, optimizer_klass, optimizer_kwargs, model, criterion, reg_func, epochs=epochs,
+        patience=patience, stop_loss=stop_loss, chunk_size=chunk_size, callback=callback)
 
-    reg_func = partial(regularizer_2d_aligned, r1, r2, indices)
-    mse_loss, total_loss, returned_model = run_optimizer(inputs, output_data, optimizer_klass, optimizer_kwargs,
-                                                         model, criterion, reg_func, epochs=epochs,
-                                                         patience=patience, stop_loss=stop_loss)
+    if dtype != torch.float64 and polish_epochs:
+        mse_loss, total_loss, returned_model, optimizer_state = _polish_fit(
+            partial(hdx_set.get_tensors, sparse=sparse, packed=packed), model, optimizer_klass, optimizer_kwargs,
+            criterion, reg_func, mse_loss, total_loss, epochs=polish_epochs, patience=patience, stop_loss=stop_loss,
+            chunk_size=chunk_size, callback=callback)
 
-    result = TorchBatchFitResult(hdx_set, model, mse_loss=mse_loss, total_loss=total_loss)
+    result = TorchBatchFitResult(hdx_set, model, mse_loss=mse_loss, total_loss=total_loss,
+                                 optimizer=optimizer, optimizer_state=optimizer_state)
     return result
 
 
@@ -598,6 +1876,44 @@ class KineticsFitResult(object):
         self.intervals = intervals  #inclusive, excluive
         self.results = results
         self.models = models
+        self._compact = False
+
+    @property
+    def hdxm(self):
+        """:class:`~pyhdx.models.HDXMeasurement`: Fitted data, resolved on first access if the fit result was
+        transferred in compact form"""
+        if isinstance(self._hdxm, HDXMeasurementReference):
+            self._hdxm = self._hdxm.resolve()
+        return self._hdxm
+
+    @hdxm.setter
+    def hdxm(self, value):
+        self._hdxm = value
+
+    def compact(self):
+        """
+        Reduces the fit results of individual blocks to their parameter values and chi squared values, and marks the
+        fit result to be serialized with a :class:`~pyhdx.models.HDXMeasurementReference` instead of a copy of the
+        fitted data (see :meth:`~pyhdx.fitting_torch.TorchFitResult.compact`).
+
+        Returns
+        -------
+        self
+
+        """
+        self.results = [KineticsResult(float(result.chi_squared), {k: float(v) for k, v in result.params.items()})
+                        for result in self.results]
+        self._compact = True
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state.get('_compact'):
+            state['_hdxm'] = HDXMeasurementReference(state['_hdxm'])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update({**state, '_compact': False})
 
     @property
     def model_type(self):
@@ -612,14 +1928,14 @@ class KineticsFitResult(object):
         #todo outdated
         d_list = []
         if self.model_type == 'Single':
-            for time in timepoints:
-                p = self.get_p(time)
+            for timepoint in timepoints:
+                p = self.get_p(timepoint)
                 p = np.nan_to_num(p)
                 d = self.hdxm.coverage.X.dot(p)
                 d_list.append(d)
         elif self.model_type == 'Global':
-            for time in timepoints:
-                d = self.get_d(time)
+            for timepoint in timepoints:
+                d = self.get_d(timepoint)
                 d_list.append(d)
 
         uptake = np.vstack(d_list).T
@@ -670,30 +1986,42 @@ class KineticsFitResult(object):
 
         """
 
+        values = self._get_block_param(name)
+        return self._expand_blocks(values)
+
+    def _get_block_param(self, name):
+        """Array of values of parameter `name` per block, NaN for blocks whose model does not have the parameter"""
+        values = [result.params.get(model.names[name], np.nan) if name in model.names else np.nan
+                  for result, model in zip(self.results, self.models)]
+        return np.array(values, dtype=float)
+
+    def _expand_blocks(self, values):
+        """Expand an array of values per block to an array of values per residue"""
         output = np.full_like(self.r_number, np.nan, dtype=float)
-        for (s, e), result, model in zip(self.intervals, self.results, self.models):
-            try:
-                dummy_name = model.names[name]  ## dummy parameter name
-                value = result.params[dummy_name]  #value is scalar
-            except KeyError:   # is a lsqmodel funky town
-                value = model.get_param_values(name, **result.params)  #value is vector
-                #values = model.get_parameter(name)            #todo unify nomenclature param/parameter
+        if len(values) == 0:
+            return output
 
-            i0, i1 = np.searchsorted(self.r_number, [s, e])
-            output[i0:i1] = value
+        i0, i1 = np.searchsorted(self.r_number, np.array(self.intervals).T)
+        lengths = i1 - i0
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        output[np.repeat(i0, lengths) + offsets] = np.repeat(values, lengths)
 
         return output
 
     @property
     def rate(self):
         """Returns an array with the exchange rates"""
-        #todo pd series/dataframe in favour of searchsorted
-        output = np.full_like(self.r_number, np.nan, dtype=float)
-        for (s, e), result, model in zip(self.intervals, self.results, self.models):
-            rate = model.get_rate(**result.params)
-            i0, i1 = np.searchsorted(self.r_number, [s, e])
-            output[i0:i1] = rate
-        return output
+        two_component = np.array([isinstance(model, (TwoComponentAssociationModel, TwoComponentDissociationModel))
+                                  for model in self.models], dtype=bool)
+
+        rates = np.full(len(self.models), np.nan)
+        if two_component.any():
+            k1, k2, r = [self._get_block_param(name)[two_component] for name in ['k1', 'k2', 'r']]
+            rates[two_component] = two_component_rate(k1, k2, r)
+        for i in np.flatnonzero(~two_component):
+            rates[i] = self.models[i].get_rate(**self.results[i].params)
+
+        return self._expand_blocks(rates)
 
     @property
     def tau(self):
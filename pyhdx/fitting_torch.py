@@ -5,44 +5,138 @@ import torch as t
 from scipy import constants
 import numpy as np
 import pandas as pd
-from pyhdx.models import Protein
+from scipy.linalg import cholesky_banded
+from scipy.stats import norm
+from pyhdx.models import Protein, HDXMeasurementReference
 
 
 class DeltaGFit(nn.Module):
-    def __init__(self, deltaG):
+    def __init__(self, deltaG, packed=False):
         super(DeltaGFit, self).__init__()
         self.deltaG = deltaG
+        self.packed = packed  # Inputs are in the packed representation (see `coverage_matmul`)
 
     def forward(self, temperature, X, k_int, timepoints):
         """
         # inputs, list of:
             temperatures: scalar (1,)
-            X (N_peptides, N_residues)
+            X (N_peptides, N_residues), dense or sparse COO, or packed (see `coverage_matmul`)
             k_int: (N_peptides, 1)
 
         """
 
+        return coverage_matmul(X, self.uptake(temperature, k_int, timepoints), packed=self.packed)
+
+    def uptake(self, temperature, k_int, timepoints):
+        """Returns the D-uptake per residue, shape (N_residues, N_timepoints)"""
         pfact = t.exp(self.deltaG / (constants.R * temperature))
-        uptake = 1 - t.exp(-t.matmul((k_int / (1 + pfact)), timepoints))
+        return 1 - t.exp(-t.matmul((k_int / (1 + pfact)), timepoints))
+
+
+class BlockDeltaGFit(DeltaGFit):
+    """
+    DeltaG fit model with one deltaG parameter per block of residues. Blocks are expanded to residues by indexing such
+    that `deltaG` has the same shape as in :class:`~pyhdx.fitting_torch.DeltaGFit`.
+
+    Parameters
+    ----------
+    deltaG_blocks : :class:`~torch.nn.Parameter`
+        DeltaG values per block, shape (..., N_blocks, 1)
+    block_index : :class:`~numpy.ndarray`
+        Index of the block for each residue, shape (N_residues, )
+    packed : :obj:`bool`
+        If `True`, inputs are in the packed representation (see :func:`~pyhdx.fitting_torch.coverage_matmul`)
+
+    """
+    def __init__(self, deltaG_blocks, block_index, packed=False):
+        nn.Module.__init__(self)
+        self.deltaG_blocks = deltaG_blocks
+        self.packed = packed
+        self.register_buffer('block_index', t.as_tensor(block_index, dtype=t.long))
+
+    @property
+    def deltaG(self):
+        return self.deltaG_blocks[..., self.block_index, :]
+
+
+def coverage_matmul(X, uptake, packed=False):
+    """
+    Matrix product of the coverage matrix `X` and residue `uptake`, where `X` can be either a dense or a sparse COO
+    tensor.
+
+    Parameters
+    ----------
+    X : :class:`~torch.Tensor`
+        Coverage matrix, shape (N_peptides, N_residues) or (N_samples, N_peptides, N_residues), or packed coverage
+        matrix of shape (N_peptides_total, N_samples*N_residues).
+    uptake : :class:`~torch.Tensor`
+        Uptake per residue, shape (N_residues, N_timepoints) or (N_samples, N_residues, N_timepoints). When `X` is
+        two-dimensional and `uptake` three-dimensional, `X` is broadcast along the first axis, unless `packed` is
+        `True`.
+    packed : :obj:`bool`
+        If `True`, `X` is a packed coverage matrix (see :meth:`~pyhdx.models.HDXMeasurementSet.get_tensors`) and the
+        output has shape (N_peptides_total, N_timepoints).
+
+    Returns
+    -------
+    output : :class:`~torch.Tensor`
+        Uptake per peptide
+
+    """
+    if packed:
+        uptake = uptake.reshape(-1, uptake.shape[-1])
+        return t.sparse.mm(X, uptake) if X.is_sparse else t.matmul(X, uptake)
+    elif not X.is_sparse:
         return t.matmul(X, uptake)
+    elif X.dim() == 3:
+        return t.bmm(X, uptake)
+    elif uptake.dim() == 3:
+        Nb, Nr, Nt = uptake.shape
+        output = t.sparse.mm(X, uptake.transpose(0, 1).reshape(Nr, Nb*Nt))
+        return output.reshape(-1, Nb, Nt).transpose(0, 1)
+    else:
+        return t.sparse.mm(X, uptake)
 
 
-def estimate_errors(hdxm, deltaG):
+def estimate_errors(hdxm, deltaG, method='analytic'):
     """
-    Calculate covariances
+    Calculate covariances from the Hessian of the mean squared error loss at the given deltaG values.
 
     Parameters
     ----------
     hdxm : :class:`~pyhdx.models.HDXMeasurement`
-    deltaG : :class:`~numpy.ndarray`
-        Array with deltaG values.
+    deltaG : :class:`~pandas.Series`
+        Series with deltaG values, index is residue numbers.
+    method : :obj:`str`
+        Either 'analytic' or 'autograd'. The 'analytic' method calculates the Hessian analytically and uses its banded
+        structure (residues are only coupled through peptides covering both) to calculate only the diagonal of the
+        inverse. The 'autograd' method calculates the Hessian with PyTorch autograd and inverts the full matrix.
 
     Returns
     -------
+    covariance : :class:`~pandas.Series`
+        Series with covariances of deltaG values of exchanging residues.
 
     """
     joined = pd.concat([deltaG, hdxm.coverage['exchanges']], axis=1, keys=['dG', 'ex'])
-    dG = joined.query('ex==True')['dG']
+    dG = joined.query('ex==True')['dG'].astype(float)  # Errors are always estimated in double precision
+
+    if method == 'analytic':
+        hessian_band = hessian_banded(hdxm, dG.to_numpy())
+        try:
+            hessian_inverse_diagonal = banded_inverse_diagonal(hessian_band)
+        except np.linalg.LinAlgError:  # Not positive definite, fall back to dense inversion
+            hessian_inverse_diagonal = np.diagonal(np.linalg.inv(banded_to_dense(hessian_band)))
+        covariance = np.sqrt(np.abs(hessian_inverse_diagonal))
+    elif method == 'autograd':
+        covariance = _estimate_errors_autograd(hdxm, dG)
+    else:
+        raise ValueError(f"Invalid value for 'method': {method}")
+
+    return pd.Series(covariance, index=dG.index, name='covariance')
+
+
+def _estimate_errors_autograd(hdxm, dG):
     deltaG = t.tensor(dG.to_numpy(), dtype=t.float64)
 
     tensors = hdxm.get_tensors(exchanges=True)
@@ -60,7 +154,116 @@ def estimate_errors(hdxm, deltaG):
     hessian_inverse = t.inverse(-hessian)
     covariance = np.sqrt(np.abs(np.diagonal(hessian_inverse)))
 
-    return pd.Series(covariance, index=dG.index, name='covariance')
+    return covariance
+
+
+def hessian_banded(hdxm, deltaG):
+    """
+    Calculate the Hessian of the mean squared error loss with respect to deltaG of exchanging residues analytically.
+
+    With residuals R = X U - D, where U (Nr x Nt) is the uptake per residue, the Hessian is given by:
+    H = 2 (XᵀX) ⊙ (U' U'ᵀ) + 2 diag(Σ_t (XᵀR) ⊙ U''), where primes denote derivatives with respect to deltaG. As
+    XᵀX is nonzero only for residues covered by the same peptide, H is a banded matrix.
+
+    Parameters
+    ----------
+    hdxm : :class:`~pyhdx.models.HDXMeasurement`
+    deltaG : :class:`~numpy.ndarray`
+        Array with deltaG values of exchanging residues.
+
+    Returns
+    -------
+    hessian_band : :class:`~numpy.ndarray`
+        Lower band of the Hessian in LAPACK lower banded storage, `hessian_band[i - j, j] = H[i, j]` for i >= j.
+
+    """
+    bools = hdxm.coverage['exchanges'].to_numpy()
+    X = hdxm.coverage.X_sparse[:, bools]
+    k_int = hdxm.coverage['k_int'].to_numpy()[bools]
+    timepoints = hdxm.timepoints
+    RT = constants.R * hdxm.temperature
+
+    q = 1 / (1 + np.exp(-deltaG / RT))  # pfact / (1 + pfact)
+    k = k_int * (1 - q)
+    dk = -k * q / RT
+    d2k = -k * q * (1 - 2 * q) / RT**2
+
+    exp_kt = np.exp(-np.outer(k, timepoints))
+    uptake = 1 - exp_kt
+    d_uptake = timepoints * exp_kt * dk[:, np.newaxis]
+    d2_uptake = timepoints * exp_kt * d2k[:, np.newaxis] - timepoints**2 * exp_kt * dk[:, np.newaxis]**2
+
+    residuals = X @ uptake - hdxm.uptake_corrected.T
+
+    xtx = (X.T @ X).tocoo()
+    lower = xtx.row >= xtx.col
+    rows, cols = xtx.row[lower], xtx.col[lower]
+    values = 2 * xtx.data[lower] * np.einsum('ij,ij->i', d_uptake[rows], d_uptake[cols])
+
+    bandwidth = np.max(rows - cols, initial=0)
+    hessian_band = np.zeros((bandwidth + 1, len(deltaG)))
+    hessian_band[rows - cols, cols] = values
+    hessian_band[0] += 2 * np.sum((X.T @ residuals) * d2_uptake, axis=1)
+
+    return hessian_band
+
+
+def banded_to_dense(band):
+    """Convert a symmetric matrix in LAPACK lower banded storage to a dense matrix"""
+    n = band.shape[1]
+    dense = np.zeros((n, n))
+    for offset, row in enumerate(band):
+        idx = np.arange(n - offset)
+        dense[idx + offset, idx] = row[:n - offset]
+        dense[idx, idx + offset] = row[:n - offset]
+    return dense
+
+
+def banded_inverse_diagonal(band):
+    """
+    Calculate the diagonal of the inverse of a symmetric positive definite banded matrix.
+
+    The matrix is factorized by banded Cholesky decomposition, after which only the elements of the inverse within the
+    band are calculated by selected inversion (Takahashi equations). For a matrix of size N and bandwidth b this takes
+    O(N b²) time and O(N b) memory, compared to O(N³) and O(N²) for dense inversion.
+
+    Parameters
+    ----------
+    band : :class:`~numpy.ndarray`
+        Matrix in LAPACK lower banded storage, `band[i - j, j] = A[i, j]` for i >= j.
+
+    Returns
+    -------
+    diagonal : :class:`~numpy.ndarray`
+        Diagonal of the inverse matrix.
+
+    Raises
+    ------
+    LinAlgError
+        If the matrix is not positive definite.
+
+    """
+    cholesky = cholesky_banded(band, lower=True)
+    bandwidth, n = cholesky.shape[0] - 1, cholesky.shape[1]
+    diagonal = cholesky[0]
+    L = cholesky / diagonal  # Unit lower triangular factor of A = L D Lᵀ, with D = diagonal**2
+    D_inv = 1 / diagonal**2
+
+    # Elements of the inverse Z within the band, in the same banded storage
+    z_band = np.zeros_like(band)
+    i_grid, j_grid = np.indices((bandwidth, bandwidth))
+    offset_grid = np.abs(i_grid - j_grid)
+    start_grid = np.minimum(i_grid, j_grid)
+    for i in range(n - 1, -1, -1):
+        m = min(bandwidth, n - 1 - i)
+        l = L[1:m + 1, i]
+        # Z[i+1:i+m+1, i+1:i+m+1] from banded storage
+        z_sub = z_band[offset_grid[:m, :m], i + 1 + start_grid[:m, :m]]
+        z = -z_sub @ l
+        z_band[1:m + 1, i] = z
+        z_band[0, i] = D_inv[i] - l @ z
+
+    return z_band[0]
 
 
 class TorchFitResult(object):
@@ -79,6 +282,64 @@ class TorchFitResult(object):
         self.data_obj = data_obj
         self.model = model
         self.metadata = metadata
+        self._output = None
+        self._compact = False
+
+    @property
+    def data_obj(self):
+        """:class:`~pyhdx.models.HDXMeasurement` or :class:`~pyhdx.models.HDXMeasurementSet`: Fitted data, resolved
+        on first access if the fit result was transferred in compact form"""
+        if isinstance(self._data_obj, HDXMeasurementReference):
+            self._data_obj = self._data_obj.resolve()
+        return self._data_obj
+
+    @data_obj.setter
+    def data_obj(self, value):
+        self._data_obj = value
+
+    def compact(self):
+        """
+        Marks the fit result to be serialized in compact form, ie when pickled to return it from a Dask worker to
+        the process holding the fitted data. In compact form, the model is stored as arrays of its parameters, the cached output is
+        omitted, and the fitted data is stored as a :class:`~pyhdx.models.HDXMeasurementReference` which is resolved
+        on first access to the data in the receiving process.
+
+        Returns
+        -------
+        self
+
+        """
+        self._compact = True
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state.get('_compact'):
+            state['_data_obj'] = HDXMeasurementReference(state['_data_obj'])
+            state['model'] = {k: v.detach().numpy() for k, v in self.model.state_dict().items()}
+            state['_output'] = None
+        return state
+
+    def __setstate__(self, state):
+        if state.get('_compact'):
+            arrays = state['model']
+            if 'block_index' in arrays:
+                model = BlockDeltaGFit(nn.Parameter(t.tensor(arrays['deltaG_blocks'])), arrays['block_index'])
+            else:
+                model = DeltaGFit(nn.Parameter(t.tensor(arrays['deltaG'])))
+            state = {**state, 'model': model, '_compact': False}
+        self.__dict__.update(state)
+
+    @property
+    def output(self):
+        """:class:`~pyhdx.models.Protein`: Fit output with deltaG, rates and covariances, calculated on first access"""
+        if getattr(self, '_output', None) is None:
+            self._output = self.make_output()
+        return self._output.copy()
+
+    def make_output(self):
+        """Calculate the fit output, see `output`"""
+        raise NotImplementedError()
 
     @property
     def mse_loss(self):
@@ -125,7 +386,7 @@ class TorchFitResult(object):
         index is residue numbers
         """
 
-        g_values = self.model.deltaG.detach().numpy().squeeze()
+        g_values = self.model.deltaG.detach().numpy().astype(float).squeeze()
         if g_values.ndim == 1:
             deltaG = pd.Series(g_values, index=self.data_obj.coverage.index)
         else:
@@ -175,10 +436,11 @@ class TorchFitResult(object):
 
         with t.no_grad():
             tensors = self.data_obj.get_tensors()
-            inputs = [tensors[key] for key in ['temperature', 'X', 'k_int']]
-            inputs.append(t.tensor(timepoints, dtype=dtype).unsqueeze(0))
+            timepoints = t.tensor(timepoints, dtype=dtype).unsqueeze(0)
 
-            output = self.model(*inputs)
+            # Output is calculated from the unpacked tensors, independent of the representation used during fitting
+            uptake = self.model.uptake(tensors['temperature'], tensors['k_int'], timepoints)
+            output = coverage_matmul(tensors['X'], uptake)
         return output.detach().numpy()
 
 
@@ -186,8 +448,7 @@ class TorchSingleFitResult(TorchFitResult):
     def __init__(self, *args, **kwargs):
         super(TorchSingleFitResult, self).__init__(*args, **kwargs)
 
-    @property
-    def output(self):
+    def make_output(self):
         df = self.generate_output(self.data_obj, self.deltaG)
         return Protein(df)
 
@@ -196,11 +457,170 @@ class TorchBatchFitResult(TorchFitResult):
     def __init__(self, *args, **kwargs):
         super(TorchBatchFitResult, self).__init__(*args, **kwargs)
 
-    @property
-    def output(self):
+    def make_output(self):
         names = [hdxm.name for hdxm in self.data_obj.hdxm_list]
 
         dfs = [self.generate_output(hdxm, self.deltaG[g_column]) for hdxm, g_column in zip(self.data_obj, self.deltaG)]
         df = pd.concat(dfs, keys=names, axis=1)
 
         return Protein(df)
+
+
+class TorchRegularizationPathResult(TorchFitResult):
+    """
+    Result of a series of fits to a single :class:`~pyhdx.models.HDXMeasurement` with different values of the
+    regularizer `r1`. Loss properties return arrays with one entry per value of `r1`.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(TorchRegularizationPathResult, self).__init__(*args, **kwargs)
+
+    @property
+    def r1(self):
+        """:class:`~numpy.ndarray`: Values of the regularizer `r1`"""
+        return self.metadata['r1']
+
+    @property
+    def deltaG(self):
+        """:class:`~pandas.DataFrame`: deltaG values with residue numbers as index and `r1` values as columns"""
+        g_values = self.model.deltaG.detach().numpy().astype(float).squeeze(-1)
+        deltaG = pd.DataFrame(g_values.T, index=self.data_obj.coverage.index,
+                              columns=pd.Index(self.r1, name='r1'))
+
+        return deltaG
+
+    @property
+    def losses(self):
+        """:class:`~pandas.DataFrame` : dataframe with losses information per epoch, columns are (`r1`, loss name)"""
+        dfs = []
+        for mse_loss, total_loss in zip(self.metadata['mse_loss'].T, self.metadata['total_loss'].T):
+            loss_dict = {'total_loss': total_loss, 'mse_loss': mse_loss}
+            loss_dict['reg_loss'] = loss_dict['total_loss'] - loss_dict['mse_loss']
+            loss_dict['reg_percentage'] = loss_dict['reg_loss'] / loss_dict['total_loss'] * 100
+            dfs.append(pd.DataFrame(loss_dict))
+
+        loss_df = pd.concat(dfs, axis=1, keys=self.r1, names=['r1', 'quantity'])
+        loss_df.index.name = 'epoch'
+        loss_df.index += 1
+
+        return loss_df
+
+    @property
+    def final_losses(self):
+        """:class:`~pandas.DataFrame` : dataframe with final losses with `r1` values as index"""
+        loss_dict = {
+            'total_loss': self.total_loss,
+            'mse_loss': self.mse_loss,
+            'reg_loss': self.reg_loss,
+            'reg_percentage': self.regularization_percentage}
+
+        return pd.DataFrame(loss_dict, index=pd.Index(self.r1, name='r1'))
+
+    def make_output(self):
+        dfs = [self.generate_output(self.data_obj, self.deltaG[r1]) for r1 in self.r1]
+        df = pd.concat(dfs, keys=self.r1, axis=1)
+
+        return Protein(df)
+
+
+class TorchResamplingResult(object):
+    """
+    Result of refitting resampled data with :func:`~pyhdx.fitting.fit_gibbs_global_resampled`.
+
+    Parameters
+    ----------
+    fit_result : :class:`~pyhdx.fitting_torch.TorchSingleFitResult`
+        Fit result of the original data
+    replicates : :class:`~pandas.DataFrame`
+        deltaG values of resampled fits with residue numbers as index and replicates as columns
+    method : :obj:`str`
+        Resampling method, either 'bootstrap' or 'jackknife'
+    ci : :obj:`float`
+        Confidence level of the intervals
+
+    """
+    def __init__(self, fit_result, replicates, method='bootstrap', ci=0.95):
+        self.fit_result = fit_result
+        self.replicates = replicates
+        self.method = method
+        self.ci = ci
+
+    @property
+    def data_obj(self):
+        return self.fit_result.data_obj
+
+    @property
+    def deltaG(self):
+        """:class:`~pandas.Series`: deltaG values of the fit to the original data"""
+        return self.fit_result.deltaG
+
+    @property
+    def interval(self):
+        """:class:`~pandas.DataFrame`: Lower and upper bounds of the confidence interval of deltaG values"""
+        if self.method == 'bootstrap':
+            q = np.array([1 - self.ci, 1 + self.ci]) * 50
+            lower, upper = np.percentile(self.replicates.to_numpy(), q, axis=1)
+        elif self.method == 'jackknife':
+            n = self.replicates.shape[1]
+            deviations = self.replicates.sub(self.replicates.mean(axis=1), axis=0)
+            std_error = np.sqrt((n - 1) / n * (deviations**2).sum(axis=1)).to_numpy()
+            z = norm.ppf(0.5 + self.ci / 2)
+            lower, upper = self.deltaG.to_numpy() - z*std_error, self.deltaG.to_numpy() + z*std_error
+        else:
+            raise ValueError(f"Invalid resampling method: {self.method}")
+
+        return pd.DataFrame({'deltaG_lower': lower, 'deltaG_upper': upper}, index=self.replicates.index)
+
+    @property
+    def output(self):
+        """:class:`~pyhdx.models.Protein`: Fit output with additional columns `deltaG_lower` and `deltaG_upper`"""
+        df = self.fit_result.output.df
+        interval = self.interval.reindex(df.index)
+        interval[df['deltaG'].isna()] = np.nan  # Non-exchanging residues
+        df = df.join(interval)
+
+        return Protein(df)
+
+
+class TorchCrossValidationResult(object):
+    """
+    Result of k-fold cross-validation of regularizer values with :func:`~pyhdx.fitting.fit_gibbs_cross_validation`.
+
+    Parameters
+    ----------
+    data_obj : :class:`~pyhdx.models.HDXMeasurement` or :class:`~pyhdx.models.HDXMeasurementSet`
+        Cross-validated data
+    scores : :class:`~pandas.DataFrame`
+        Tidy dataframe with one row per fold and value of the regularizer(s), with columns 'fold', the regularizer
+        names, 'train_mse' and 'test_mse'.
+    holdout : :obj:`str`
+        Either 'peptides' or 'timepoints'
+
+    """
+    def __init__(self, data_obj, scores, holdout='peptides'):
+        self.data_obj = data_obj
+        self.scores = scores
+        self.holdout = holdout
+
+    @property
+    def regularizers(self):
+        """:obj:`list`: Names of the cross-validated regularizers"""
+        return [name for name in ['r1', 'r2'] if name in self.scores.columns]
+
+    @property
+    def summary(self):
+        """:class:`~pandas.DataFrame`: Mean and standard error of the train and test mean squared errors over folds,
+        with values of the regularizers as index"""
+        grouped = self.scores.groupby(self.regularizers)
+        df = grouped[['train_mse', 'test_mse']].mean()
+        df['test_mse_sem'] = grouped['test_mse'].sem()
+
+        return df
+
+    @property
+    def recommended(self):
+        """:obj:`dict`: Values of the regularizers with the lowest mean test mean squared error"""
+        best = self.summary['test_mse'].idxmin()
+        best = best if isinstance(best, tuple) else (best,)
+
+        return dict(zip(self.regularizers, best))
@@ -12,8 +12,15 @@ from pyhdx.support import reduce_inter, make_view, fields_view, pprint_df_to_fil
 from pyhdx.fileIO import fmt_export
 from pyhdx.alignment import align_dataframes
 from scipy import constants
+from scipy.sparse import csr_matrix
 import pyhdx
 import torch
+import uuid
+import weakref
+
+
+# HDXMeasurement objects in the current process by their `uid`, used to resolve serialized references
+_hdxm_registry = weakref.WeakValueDictionary()
 
 
 def protein_wrapper(func, *args, **kwargs):
@@ -506,9 +513,9 @@ class Coverage(object):
     Attributes
     ----------
 
-    X : :class:`~numpy.ndarray`
-        N x M matrix where N is the number of peptides and M equal to `prot_len`.
-        Values are 1/(ex_residues) where there is coverage.
+    X_sparse : :class:`~scipy.sparse.csr_matrix`
+        N x M matrix where N is the number of peptides and M equal to `prot_len`, in compressed sparse row format.
+        Values are 1 where there is coverage. The dense matrix is available as `X`.
     Z : :class:`~numpy.ndarray`
         N x M matrix where N is the number of peptides and M equal to `prot_len`.
         Values are 1/(ex_residues) where there is coverage,
@@ -563,15 +570,20 @@ class Coverage(object):
 
         # matrix dimensions N_peptides N_residues, dtype for TF compatibility
         _exchanges = self['exchanges']  # Array only on covered part
-        self.X = np.zeros((len(self.data), self.interval[1] - self.interval[0]), dtype=int)
-        self.Z = np.zeros_like(self.X, dtype=float)
+        self.Z = np.zeros((len(self.data), self.interval[1] - self.interval[0]), dtype=float)
+        rows, cols = [], []
         for row, entry in enumerate(self.data):
             i0, i1 = np.searchsorted(self.r_number, (entry['start'], entry['end']))
-            self.X[row][i0:i1] = 1
+            rows.append(np.full(i1 - i0, row))
+            cols.append(np.arange(i0, i1))
             self.Z[row][i0:i1] = _exchanges[i0:i1]
 
         self.Z = self.Z / self.data['ex_residues'][:, np.newaxis]
 
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        self.X_sparse = csr_matrix((np.ones(len(rows), dtype=int), (rows, cols)), shape=self.Z.shape)
+        self._X = None  # Dense X is created on first access
+
     def __len__(self):
         return len(self.data)
 
@@ -643,6 +655,21 @@ class Coverage(object):
         block_length = diffs[diffs != 0]
         return block_length
 
+    @property
+    def block_index(self):
+        """:class:`~numpy.ndarray`: Index of the block each residue belongs to along the `r_number` axis, where blocks
+            are contiguous residues with identical columns in `X`"""
+
+        changes = np.any(self.X[:, 1:] != self.X[:, :-1], axis=0)
+        return np.concatenate([[0], np.cumsum(changes)])
+
+    @property
+    def X(self):
+        """:class:`~numpy.ndarray`: `X` coefficient matrix as dense array, created from `X_sparse` on first access."""
+        if self._X is None:
+            self._X = self.X_sparse.toarray()
+        return self._X
+
     @property
     def X_norm(self):
         """:class:`~numpy.ndarray`: `X` coefficient matrix normalized column wise."""
@@ -725,6 +752,16 @@ class HDXMeasurement(object):
         if self.temperature and self.pH:
             self.coverage.protein.set_k_int(self.temperature, self.pH)
 
+        # Unique identifier, identical for copies of this object in other processes
+        self.uid = uuid.uuid4().hex
+        _hdxm_registry[self.uid] = self
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'uid' not in state:  # Pickled by a version without identifiers
+            self.uid = uuid.uuid4().hex
+        _hdxm_registry.setdefault(self.uid, self)
+
     @property
     def name(self):
         return self.metadata.get('name', self.state)
@@ -784,7 +821,7 @@ class HDXMeasurement(object):
         uptake_corrected = np.stack([v.uptake_corrected for v in self])
         return uptake_corrected
 
-    def get_tensors(self, exchanges=False):
+    def get_tensors(self, exchanges=False, sparse=False, dtype=torch.float64):
         """
         Returns a dictionary of tensor variables for fitting to Linderstrøm-Lang kinetics.
 
@@ -799,6 +836,10 @@ class HDXMeasurement(object):
         ----------
         exchanges : :obj:`bool`
             if True only returns tensor data describing residues which exchange (ie have peptides and are not prolines)
+        sparse : :obj:`bool`
+            if True the coverage matrix `X` is returned as a sparse COO tensor
+        dtype : :class:`~torch.dtype`
+            Floating point type of the returned tensors
 
         Returns
         -------
@@ -806,7 +847,6 @@ class HDXMeasurement(object):
         tensors : :obj:`dict`
 
         """
-        dtype = torch.float64
         if 'k_int' not in self.coverage.protein:
             raise ValueError("Unknown intrinsic rates of exchange, please supply pH and temperature parameters")
         try:
@@ -820,9 +860,10 @@ class HDXMeasurement(object):
         else:
             bools = np.ones(self.Nr, dtype=bool)
 
+        X = self.coverage.X[:, bools]
         tensors = {
             'temperature': torch.tensor([self.temperature], dtype=dtype).unsqueeze(-1),
-            'X': torch.tensor(self.coverage.X[:, bools], dtype=dtype),
+            'X': sparse_tensor(X, dtype=dtype) if sparse else torch.tensor(X, dtype=dtype),
             'k_int': torch.tensor(self.coverage['k_int'].to_numpy()[bools], dtype=dtype).unsqueeze(-1),
             'timepoints': torch.tensor(self.timepoints, dtype=dtype).unsqueeze(0),
             'uptake': torch.tensor(self.uptake_corrected.T, dtype=dtype)}
@@ -1001,6 +1042,44 @@ class CoverageSet(object):
         return mask_dict
 
 
+class HDXMeasurementReference(object):
+    """
+    Reference to a :class:`~pyhdx.models.HDXMeasurement` or :class:`~pyhdx.models.HDXMeasurementSet`, used to
+    serialize fit results without a copy of their input data. References are resolved to the objects with the same
+    `uid` in the current process.
+
+    Parameters
+    ----------
+    data_obj : :class:`~pyhdx.models.HDXMeasurement` or :class:`~pyhdx.models.HDXMeasurementSet`
+
+    """
+    def __init__(self, data_obj):
+        if isinstance(data_obj, HDXMeasurementSet):
+            self.uid = [hdxm.uid for hdxm in data_obj]
+            self.alignment = (data_obj.aligned_indices, data_obj.aligned_pairs, data_obj.aligned_dataframes)
+        else:
+            self.uid = data_obj.uid
+
+    def resolve(self):
+        """
+        Returns the referenced object. For an :class:`~pyhdx.models.HDXMeasurementSet`, a new set is created from the
+        referenced :class:`~pyhdx.models.HDXMeasurement` objects.
+
+        """
+        uids = self.uid if isinstance(self.uid, list) else [self.uid]
+        try:
+            hdxm_list = [_hdxm_registry[uid] for uid in uids]
+        except KeyError:
+            raise ValueError("Referenced HDX measurement is not available in the current process")
+
+        if isinstance(self.uid, list):
+            hdx_set = HDXMeasurementSet(hdxm_list)
+            hdx_set.aligned_indices, hdx_set.aligned_pairs, hdx_set.aligned_dataframes = self.alignment
+            return hdx_set
+        else:
+            return hdxm_list[0]
+
+
 class HDXMeasurementSet(object):
     """
     multiple HDX Measurements
@@ -1014,6 +1093,8 @@ class HDXMeasurementSet(object):
 
         # Index array of of shape Ns x y where indices apply to deltaG return aligned residues for
         self.aligned_indices = None
+        # Flat index array of shape 2 x Npairs into deltaG (Ns x Nr) of pairs of aligned residues
+        self.aligned_pairs = None
         self.aligned_dataframes = None
 
     def __iter__(self):
@@ -1076,31 +1157,99 @@ class HDXMeasurementSet(object):
 
     def add_alignment(self, alignment, first_r_numbers=None):
         """
+        Add alignment information of the measured proteins.
+
+        Sets `aligned_indices`, the indices of residues aligned in all states (shape Ns x y), and `aligned_pairs`, the
+        flat indices into the deltaG array (shape Ns x Nr) of pairs of aligned residues (shape 2 x Npairs). At each
+        position in the alignment, every aligned residue is paired with the residue of the first state aligned at
+        that position, such that the number of pairs scales linearly with the number of states.
+
+        Parameters
+        ----------
+        alignment : :obj:`list`
+            Alignment as list of strings with single-letter amino acids codes where gaps are '-'.
+        first_r_numbers : :obj:`list`, optional
+            Residue numbers corresponding to the first residue in the alignment sequences, default is [1, 1, ...]
 
-        :param alignment: list
-        :param first_r_numbers:
-            default is [1, 1, ...] but specifiy here if alignments do not all start at residue 1
-        :return:
         """
         dfs = [hdxm.coverage.protein.df for hdxm in self.hdxm_list]
         self.aligned_dataframes = align_dataframes(dfs, alignment, first_r_numbers)
 
-        df = self.aligned_dataframes['r_number']
+        r_number = self.aligned_dataframes['r_number'].to_numpy(dtype=float, na_value=np.nan)
+
+        # Residues within the interval range, first residue in interval selected by index 0
+        with np.errstate(invalid='ignore'):
+            aligned = (self.coverage.interval[0] <= r_number) & (r_number < self.coverage.interval[1])
+        indices = np.where(aligned, r_number - self.coverage.interval[0], 0).astype(int)
+
+        self.aligned_indices = indices[aligned.all(axis=1)].T
+
+        rows, states = np.nonzero(aligned)
+        reference = np.argmax(aligned, axis=1)[rows]
+        b = states != reference
+        rows, states, reference = rows[b], states[b], reference[b]
+        self.aligned_pairs = np.stack([reference * self.Nr + indices[rows, reference],
+                                       states * self.Nr + indices[rows, states]])
+
+    def get_tensors(self, sparse=False, packed=False, dtype=torch.float64):
+        """
+        Returns a dictionary of tensor variables for batch fitting to Linderstrøm-Lang kinetics. Data of all
+        measurements is padded to the largest number of peptides and timepoints.
+
+        Tensor variables are (shape):
+        Temperature (Ns x 1 x 1)
+        X (Ns x Np x Nr)
+        k_int (Ns x Nr x 1)
+        timepoints (Ns x 1 x Nt)
+        uptake (D) (Ns x Np x Nt)
 
-        # Crop residue numbers to interval range
-        df = df[((self.coverage.interval[0] <= df) & (df < self.coverage.interval[1])).all(axis=1)]
-        df = df - self.coverage.interval[0]  # First residue in interval selected by index 0
-        df.dropna(how='any', inplace=True)  # Remove non-aligned residues
+        In the packed representation, peptides of all measurements are concatenated instead of padded to the largest
+        number of peptides. `X` is then a sparse COO tensor of shape (ΣNp x Ns*Nr), whose columns index the flattened
+        (Ns x Nr) residues of all measurements, and `uptake` has shape (ΣNp x Nt).
 
-        self.aligned_indices = df.to_numpy(dtype=int).T
+        Parameters
+        ----------
+        sparse : :obj:`bool`
+            if True the coverage matrix `X` is returned as a sparse COO tensor
+        packed : :obj:`bool`
+            if True `X` and `uptake` are returned in the packed representation.
+        dtype : :class:`~torch.dtype`
+            Floating point type of the returned tensors
+
+        Returns
+        -------
+
+        tensors : :obj:`dict`
 
-    def get_tensors(self):
+        """
         #todo create correct shapes as per table X for all
         temperature = np.array([kf.temperature for kf in self.hdxm_list])
 
-        X_values = np.concatenate([hdxm.coverage.X.flatten() for hdxm in self.hdxm_list])
-        X = np.zeros((self.Ns, self.Np, self.Nr))
-        X[self.masks['spr']] = X_values
+        if packed:
+            offsets = np.array([hdxm.coverage.interval[0] for hdxm in self.hdxm_list]) - self.coverage.interval[0]
+            p_offsets = np.cumsum([0] + [hdxm.Np for hdxm in self.hdxm_list])
+            indices = []
+            for i, (hdxm, offset, p_offset) in enumerate(zip(self.hdxm_list, offsets, p_offsets)):
+                p, r = np.nonzero(hdxm.coverage.X)
+                indices.append(np.stack([p + p_offset, i*self.Nr + r + offset]))
+            indices = np.concatenate(indices, axis=1)
+            X = torch.sparse_coo_tensor(indices, np.ones(indices.shape[1]), size=(p_offsets[-1], self.Ns*self.Nr),
+                                        dtype=dtype).coalesce()
+        elif sparse:
+            # Build the indices of nonzero elements directly to avoid creating the padded dense matrix
+            offsets = np.array([hdxm.coverage.interval[0] for hdxm in self.hdxm_list]) - self.coverage.interval[0]
+            indices = []
+            for i, (hdxm, offset) in enumerate(zip(self.hdxm_list, offsets)):
+                p, r = np.nonzero(hdxm.coverage.X)
+                indices.append(np.stack([np.full_like(p, i), p, r + offset]))
+            indices = np.concatenate(indices, axis=1)
+            X = torch.sparse_coo_tensor(indices, np.ones(indices.shape[1]), size=(self.Ns, self.Np, self.Nr),
+                                        dtype=dtype).coalesce()
+        else:
+            X_values = np.concatenate([hdxm.coverage.X.flatten() for hdxm in self.hdxm_list])
+            X = np.zeros((self.Ns, self.Np, self.Nr))
+            X[self.masks['spr']] = X_values
+            X = torch.tensor(X, dtype=dtype)
 
         k_int_values = np.concatenate([hdxm.coverage['k_int'].to_numpy() for hdxm in self.hdxm_list])
         k_int = np.zeros((self.Ns, self.Nr))
@@ -1110,15 +1259,18 @@ class HDXMeasurementSet(object):
         timepoints = np.zeros((self.Ns, self.Nt))
         timepoints[self.masks['st']] = timepoints_values
 
-        D_values = np.concatenate([hdxm.uptake_corrected.T.flatten() for hdxm in self.hdxm_list])
-        D = np.zeros((self.Ns, self.Np, self.Nt))
-        D[self.masks['spt']] = D_values
-
-        dtype = torch.float64
+        if packed:
+            D = np.zeros((p_offsets[-1], self.Nt))
+            for hdxm, p_offset in zip(self.hdxm_list, p_offsets):
+                D[p_offset:p_offset + hdxm.Np, self.Nt - hdxm.Nt:] = hdxm.uptake_corrected.T
+        else:
+            D_values = np.concatenate([hdxm.uptake_corrected.T.flatten() for hdxm in self.hdxm_list])
+            D = np.zeros((self.Ns, self.Np, self.Nt))
+            D[self.masks['spt']] = D_values
 
         tensors = {
             'temperature': torch.tensor(temperature, dtype=dtype).reshape(self.Ns, 1, 1),
-            'X': torch.tensor(X, dtype=dtype),
+            'X': X,
             'k_int': torch.tensor(k_int, dtype=dtype).reshape(self.Ns, self.Nr, 1),
             'timepoints': torch.tensor(timepoints, dtype=dtype).reshape(self.Ns, 1, self.Nt),
             'uptake': torch.tensor(D, dtype=dtype)  #todo this is called uptake_corrected/D/uptake
@@ -1135,6 +1287,28 @@ class HDXMeasurementSet(object):
         return exchanges
 
 
+def sparse_tensor(array, dtype=torch.float64):
+    """
+    Convert a (dense) numpy array to a sparse COO :class:`~torch.Tensor`
+
+    Parameters
+    ----------
+    array : :class:`~numpy.ndarray`
+        Input array
+    dtype : :class:`~torch.dtype`
+        Data type of the returned tensor
+
+    Returns
+    -------
+    tensor : :class:`~torch.Tensor`
+        Sparse (coalesced) tensor with the nonzero values of `array`
+
+    """
+    indices = np.nonzero(array)
+    tensor = torch.sparse_coo_tensor(np.stack(indices), array[indices], size=array.shape, dtype=dtype)
+    return tensor.coalesce()
+
+
 #https://stackoverflow.com/questions/4494404/find-large-number-of-consecutive-values-fulfilling-condition-in-a-numpy-array
 def contiguous_regions(condition):
     """Finds contiguous True regions of the boolean array "condition". Returns
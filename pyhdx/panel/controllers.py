@@ -1,7 +1,10 @@
 import operator
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 import zipfile
 from collections import namedtuple
+from functools import partial
 from io import StringIO, BytesIO
 from pathlib import Path
 
@@ -18,8 +21,9 @@ from skimage.filters import threshold_multiotsu
 
 from pyhdx import VERSION_STRING
 from pyhdx.fileIO import read_dynamx, txt_to_np, csv_to_protein, txt_to_protein, csv_to_dataframe
-from pyhdx.fitting import fit_rates_weighted_average, fit_rates_half_time_interpolate, get_bounds, fit_gibbs_global, \
-    fit_gibbs_global_batch
+from pyhdx.fitting import fit_rates_weighted_average, fit_rates_weighted_average_vectorized, \
+    fit_rates_half_time_interpolate, get_bounds, fit_gibbs_global_multi, \
+    fit_gibbs_global_batch, optimizer_defaults, FitProgress, fit_compact
 from pyhdx.models import PeptideMasterTable, HDXMeasurement, Protein, array_intersection
 from pyhdx.panel.base import ControlPanel, DEFAULT_COLORS, DEFAULT_CLASS_COLORS
 from pyhdx.panel.sources import DataSource, DataFrameSource
@@ -239,6 +243,8 @@ class PeptideFileInputControl(ControlPanel):
     n_term = param.Integer(1, doc='Index of the n terminal residue in the protein. Can be set to negative values to '
                                   'accommodate for purification tags. Used in the determination of intrinsic rate of exchange')
     sequence = param.String('', doc='Optional FASTA protein sequence')
+    use_cache = param.Boolean(False, doc='Store parsed input files in the on-disk cache (~/.pyhdx/cache) such that '
+                                         'repeated loads of the same files are not parsed again.')
     dataset_name = param.String()
     add_dataset_button = param.Action(lambda self: self._action_add_dataset(), label='Add dataset',
                                 doc='Parse selected peptides for further analysis and apply back-exchange correction')
@@ -253,6 +259,8 @@ class PeptideFileInputControl(ControlPanel):
         self.update_box()
 
         self._array = None  # Numpy array with raw input data
+        self._read_executor = ThreadPoolExecutor(max_workers=1)
+        self._read_future = None  # Future of the most recent read of input files
 
     @property
     def _layout(self):
@@ -292,16 +300,34 @@ class PeptideFileInputControl(ControlPanel):
     def _read_files(self):
         """"""
         if self.input_files:
-            combined_array = read_dynamx(*[StringIO(byte_content.decode('UTF-8')) for byte_content in self.input_files])
-            self._array = combined_array
+            # Files are decoded and parsed in a local thread and the result is handled in `_files_read` such that the
+            # UI stays responsive while loading, without sending the files to and the parsed data back from Dask workers
+            input_files, use_cache = self.input_files, self.use_cache
 
-            self.parent.logger.info(
-                f'Loaded {len(self.input_files)} file{"s" if len(self.input_files) > 1 else ""} with a total '
-                f'of {len(self._array)} peptides')
+            def read_files():
+                return read_dynamx(*[StringIO(byte_content.decode('UTF-8')) for byte_content in input_files],
+                                   cache=use_cache)
 
+            future = self._read_executor.submit(read_files)
+            self._read_future = future
+            self.parent.future_queue.append((future, self._files_read))
         else:
+            self._read_future = None
             self._array = None
+            self._update_input_states()
+
+    def _files_read(self, future):
+        if future is not self._read_future:  # Input files were changed while reading
+            return
+
+        self._array = future.result()
+        self.parent.logger.info(
+            f'Loaded {len(self.input_files)} file{"s" if len(self.input_files) > 1 else ""} with a total '
+            f'of {len(self._array)} peptides')
 
+        self._update_input_states()
+
+    def _update_input_states(self):
         self._update_fd_state()
         self._update_fd_exposure()
         self._update_exp_state()
@@ -449,7 +475,8 @@ class InitialGuessControl(ControlPanel):
 
     #todo remove lambda symbol although its really really funny
     header = 'Initial Guesses'
-    fitting_model = param.Selector(default='Half-life (λ)', objects=['Half-life (λ)', 'Association'],
+    fitting_model = param.Selector(default='Half-life (λ)',
+                                   objects=['Half-life (λ)', 'Association', 'Association (vectorized)'],
                                    doc='Choose method for determining initial guesses.')
     dataset = param.Selector(default='', doc='Dataset to apply bounds to')
     global_bounds = param.Boolean(default=False, doc='Set bounds globally across all datasets')
@@ -492,7 +519,7 @@ class InitialGuessControl(ControlPanel):
         if self.fitting_model == 'Half-life (λ)':
             excluded = ['dataset', 'lower_bound', 'upper_bound', 'global_bounds']
 
-        elif self.fitting_model in ['Association', 'Dissociation']:
+        elif self.fitting_model in ['Association', 'Dissociation', 'Association (vectorized)']:
             excluded = []
 
         self.own_widget_names = [name for name in self.widgets.keys() if name not in excluded]
@@ -568,12 +595,22 @@ class InitialGuessControl(ControlPanel):
             else:
                 bounds = self.bounds.values()
 
-            futures = self.parent.client.map(fit_rates_weighted_average,
+            futures = self.parent.client.map(partial(fit_compact, fit_rates_weighted_average),
                                              self.parent.data_objects.values(), bounds, client='worker_client')
+        elif self.fitting_model == 'Association (vectorized)':  # fits all blocks at once, no need for worker_client
+            if self.global_bounds:
+                bounds = [(self.lower_bound, self.upper_bound)]*num_samples
+            else:
+                bounds = self.bounds.values()
+
+            futures = self.parent.client.map(partial(fit_compact, fit_rates_weighted_average_vectorized),
+                                             self.parent.data_objects.values(), bounds)
         elif self.fitting_model == 'Half-life (λ)':   # this is practically instantaneous and does not require dask
-            futures = self.parent.client.map(fit_rates_half_time_interpolate, self.parent.data_objects.values())
+            futures = self.parent.client.map(partial(fit_compact, fit_rates_half_time_interpolate),
+                                             self.parent.data_objects.values())
 
-        dask_future = self.parent.client.submit(lambda args: args, futures)
+        # Combine list of futures into one future object, results are returned without copies of the datasets
+        dask_future = self.parent.client.submit(list, futures)
         self._guess_names[dask_future.key] = self.guess_name
 
         self.parent.future_queue.append((dask_future, self.add_fit_result))
@@ -592,6 +629,9 @@ class FitControl(ControlPanel):
 
     fit_mode = param.Selector(default='Batch', objects=['Batch', 'Single'])
 
+    optimizer = param.Selector(default='SGD', objects=['SGD', 'LBFGS'],
+                               doc='Optimizer to use. LBFGS is a quasi-Newton method which converges in fewer epochs.')
+
     stop_loss = param.Number(0.01, bounds=(0, None),
                              doc='Threshold loss difference below which to stop fitting.')
     stop_patience = param.Integer(100, bounds=(1, None),
@@ -615,6 +655,9 @@ class FitControl(ControlPanel):
     do_fit = param.Action(lambda self: self._action_fit(), constant=True, label='Do Fitting',
                           doc='Start global fitting')
 
+    cancel_fit = param.Action(lambda self: self._action_cancel(), constant=True, label='Cancel Fitting',
+                              doc='Stop all running fits, fit results are obtained from the current parameters')
+
     def __init__(self, parent, **params):
         self.pbar1 = ASyncProgressBar() #tqdm?
         super(FitControl, self).__init__(parent, **params)
@@ -625,6 +668,37 @@ class FitControl(ControlPanel):
         self._current_jobs = 0
         self._max_jobs = 2  #todo config
         self._fit_names = {}
+        self._fit_progress = {}  # FitProgress objects of running fits, keys are future keys
+        # Progress is read from the Dask scheduler in a background thread such that the UI thread is not blocked
+        self._progress_executor = ThreadPoolExecutor(max_workers=1)
+        self._progress_future = None
+
+    def make_dict(self):
+        widgets = self.generate_widgets()
+        widgets.update(pbar1=self.pbar1.view)
+
+        return widgets
+
+    def update_progress(self):
+        """Shows the progress of the most recently started fit in the progress bar, called periodically by the parent
+        controller"""
+        if self._progress_future is not None:
+            if not self._progress_future.done():
+                return
+            progress = self._progress_future.result()
+            self._progress_future = None
+            if progress is not None and self._fit_progress:
+                self.pbar1.num_tasks = progress['num_steps']
+                self.pbar1.completed = progress['step']
+
+        if self._fit_progress:
+            self._progress_future = self._progress_executor.submit(
+                operator.attrgetter('progress'), list(self._fit_progress.values())[-1])
+
+    def _action_cancel(self):
+        for progress in self._fit_progress.values():
+            progress.cancel()
+        self.parent.logger.info(f'Cancelling {len(self._fit_progress)} running fit(s)')
 
     def _source_updated(self, *events):
         table = self.parent.sources['dataframe'].get('rates')
@@ -639,6 +713,12 @@ class FitControl(ControlPanel):
         if not self.initial_guess and objects:
             self.initial_guess = objects[0]
 
+    @param.depends('optimizer', watch=True)
+    def _optimizer_updated(self):
+        self.learning_rate = optimizer_defaults[self.optimizer]['lr']
+        self.param['momentum'].constant = self.optimizer != 'SGD'
+        self.param['nesterov'].constant = self.optimizer != 'SGD'
+
     @param.depends('fit_mode', watch=True)
     def _fit_mode_updated(self):
         if self.fit_mode == 'Batch' and len(self.parent.data_objects) > 1:
@@ -648,10 +728,18 @@ class FitControl(ControlPanel):
 
     def add_fit_result(self, future):
         name = self._fit_names.pop(future.key)
+        progress = self._fit_progress.pop(future.key)
         result = future.result()
         self._current_jobs -= 1
+        self.widgets['do_fit'].constant = False
+        self.param['cancel_fit'].constant = not self._fit_progress
+        self.pbar1.reset()
 
-        self.parent.logger.info(f'Finished PyTorch fit: {name}')
+        if progress.cancelled:
+            self.parent.logger.info(f'Cancelled PyTorch fit: {name}')
+        else:
+            self.parent.logger.info(f'Finished PyTorch fit: {name}')
+        self._progress_executor.submit(progress.close)  # Remove the Dask variable and event of the fit
 
         if isinstance(result, list):
             self.parent.fit_results[name] = list(result)
@@ -683,6 +771,8 @@ class FitControl(ControlPanel):
             self.widgets['do_fit'].constant = True
 
         self.parent.logger.info(f'Current number of active jobs: {self._current_jobs}')
+        # Progress is reported by the Dask worker through a named Dask Variable
+        progress = FitProgress(name=f'pyhdx_fit_{uuid.uuid4().hex}', client=self.parent.client)
         if self.fit_mode == 'Batch':
             hdx_set = self.parent.hdx_set
             rates_df = self.sources['dataframe'].get('rates', fit_ID=self.initial_guess)
@@ -690,26 +780,33 @@ class FitControl(ControlPanel):
             rates_guess = [rates_df[state]['rate'] for state in hdx_set.names]
             gibbs_guess = hdx_set.guess_deltaG(rates_guess)
 
-            dask_future = self.parent.client.submit(fit_gibbs_global_batch, hdx_set, gibbs_guess, **self.fit_kwargs)
+            dask_future = self.parent.client.submit(fit_compact, fit_gibbs_global_batch, hdx_set, gibbs_guess,
+                                                    callback=progress, **self.fit_kwargs)
         else:
-            data_objs = self.parent.data_objects.values()
+            # All datasets are fitted independently in a single batched task, which returns a list of results
+            hdx_set = self.parent.hdx_set
             rates_df = self.sources['dataframe'].get('rates', fit_ID=self.initial_guess)
-            gibbs_guesses = [data_obj.guess_deltaG(rates_df[data_obj.name]['rate']) for data_obj in data_objs]
-            futures = self.parent.client.map(fit_gibbs_global, data_objs, gibbs_guesses, **self.fit_kwargs)
 
-            # Combine list of futures into one future object
-            # See https://github.com/dask/distributed/pull/560
-            dask_future = self.parent.client.submit(lambda args: args, futures)
+            rates_guess = [rates_df[state]['rate'] for state in hdx_set.names]
+            gibbs_guess = hdx_set.guess_deltaG(rates_guess)
+
+            dask_future = self.parent.client.submit(fit_compact, fit_gibbs_global_multi, hdx_set, gibbs_guess,
+                                                    callback=progress, **self.fit_kwargs)
 
         self._fit_names[dask_future.key] = self.fit_name
+        self._fit_progress[dask_future.key] = progress
+        self.param['cancel_fit'].constant = False
         self.parent.future_queue.append((dask_future, self.add_fit_result))
 
     @property
     def fit_kwargs(self):
-        fit_kwargs = dict(r1=self.r1, lr=self.learning_rate, momentum=self.momentum, nesterov=self.nesterov,
+        fit_kwargs = dict(r1=self.r1, lr=self.learning_rate, optimizer=self.optimizer,
                           epochs=self.epochs, patience=self.stop_patience, stop_loss=self.stop_loss)
+        if self.optimizer == 'SGD':
+            fit_kwargs.update(momentum=self.momentum, nesterov=self.nesterov)
         if self.fit_mode == 'Batch':
             fit_kwargs['r2'] = self.r2
+            fit_kwargs['packed'] = True
 
         return fit_kwargs
 
@@ -1,4 +1,5 @@
 import logging
+import time
 import param
 import panel as pn
 
@@ -93,16 +94,40 @@ class MainController(param.Parameterized):
             view.update()
 
     def check_futures(self):
+        """Calls the callbacks of finished futures in the queue. Failed or cancelled futures are removed from the queue
+        and reported through the logger"""
         for future, callback in self.future_queue[:]:
-            if future.status == 'finished':
+            if not future.done():
+                continue
+            self.future_queue.remove((future, callback))
+            if future.cancelled():
+                self.logger.info(f'Task {getattr(future, "key", future)} was cancelled')
+            elif future.exception() is not None:
+                self.logger.error(f'Task {getattr(future, "key", future)} failed: {future.exception()!r}')
+            else:
                 callback(future)
-                self.future_queue.remove((future, callback))
+
+    def wait_futures(self, timeout=60.):
+        """Blocks until all futures in the queue are handled, raises :class:`TimeoutError` after `timeout` seconds"""
+        t0 = time.time()
+        while self.future_queue:
+            if time.time() - t0 > timeout:
+                raise TimeoutError(f'{len(self.future_queue)} task(s) did not finish within {timeout} seconds')
+            self.check_futures()
+            time.sleep(0.1)
 
     def start(self):
         refresh_rate = 25
-        pn.state.add_periodic_callback(
-            self.check_futures, refresh_rate
-        )
+        self._periodic_callbacks = [pn.state.add_periodic_callback(self.check_futures, refresh_rate)]
+        for ctrl in self.control_panels.values():
+            if hasattr(ctrl, 'update_progress'):
+                self._periodic_callbacks.append(pn.state.add_periodic_callback(ctrl.update_progress, 500))
+
+    def stop(self):
+        """Stops the periodic callbacks added by :meth:`start`"""
+        for callback in self._periodic_callbacks:
+            callback.stop()
+        self._periodic_callbacks = []
 
 
 class PyHDXController(MainController):
@@ -19,6 +19,8 @@ def reload_previous(dic, ctrl):
 
     file_input.input_files = binary_content
 
+    ctrl.wait_futures()  # Wait until the input files are read
+
     #todo prolines, drop_first
 
     #file_input._action_load()
@@ -0,0 +1,263 @@
+import json
+import numpy as np
+import torch
+from pyhdx.models import HDXMeasurement, HDXMeasurementSet
+from pyhdx.fitting import KineticsFitResult, KineticsResult
+from pyhdx.fitting_torch import DeltaGFit, BlockDeltaGFit, TorchSingleFitResult, TorchBatchFitResult, \
+    TorchRegularizationPathResult
+import pyhdx.fit_models
+
+try:
+    import h5py
+except ModuleNotFoundError:
+    h5py = None
+
+
+TORCH_RESULT_TYPES = {klass.__name__: klass for klass in
+                      [TorchSingleFitResult, TorchBatchFitResult, TorchRegularizationPathResult]}
+
+
+def _encode_array(array):
+    """Converts unicode fields of a structured array to UTF-8 encoded bytes fields, as HDF5 has no unicode type"""
+    fields = {name: np.char.encode(array[name], 'UTF-8') if array.dtype[name].kind == 'U' else array[name]
+              for name in array.dtype.names}
+    output = np.empty(len(array), dtype=[(name, values.dtype) for name, values in fields.items()])
+    for name, values in fields.items():
+        output[name] = values
+
+    return output
+
+
+def _decode_array(array):
+    """Converts bytes fields of a structured array read from HDF5 to unicode fields"""
+    fields = {name: np.char.decode(array[name], 'UTF-8') if array.dtype[name].kind == 'S' else array[name]
+              for name in array.dtype.names}
+    output = np.empty(len(array), dtype=[(name, values.dtype) for name, values in fields.items()])
+    for name, values in fields.items():
+        output[name] = values
+
+    return output
+
+
+def _encode_name(name):
+    """Escapes '/' (the HDF5 path separator) in `name` such that it is used as a single HDF5 group name"""
+    return name.replace('%', '%25').replace('/', '%2F')
+
+
+def _decode_name(name):
+    """Reverses :func:`~pyhdx.project._encode_name`"""
+    return name.replace('%2F', '/').replace('%25', '%')
+
+
+def _to_json(obj):
+    return json.dumps(obj, default=lambda o: o.item() if isinstance(o, np.generic) else o.tolist())
+
+
+class HDXProject(object):
+    """
+    Project file which stores HDX measurements and fit results in a HDF5 file.
+
+    Measurements are stored with their back-exchange corrected peptide tables, coverage matrix and metadata, and fit
+    results with their model parameters, losses and metadata. Arrays are stored as chunked and compressed datasets.
+    Opening a project only reads the names of the stored items, measurements and fit results are read from the file on
+    first access and measurements are shared between the fit results which refer to them.
+
+    Requires :mod:`h5py`.
+
+    Parameters
+    ----------
+    file_path : :obj:`str` or :class:`~pathlib.Path`
+        Path of the project file.
+    mode : :obj:`str`
+        File mode, 'r' to read, 'r+' to read and write, 'w' to create (truncate if exists), 'a' (default) to read and
+        write, creating the file if it does not exist.
+    compression : :obj:`str`
+        Compression filter of stored arrays.
+
+    """
+    def __init__(self, file_path, mode='a', compression='gzip'):
+        if h5py is None:
+            raise ModuleNotFoundError("Project files require 'h5py'")
+
+        self.file = h5py.File(file_path, mode)
+        self.compression = compression
+        self._measurements = {}  # Measurements loaded from the file by name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def measurement_names(self):
+        """:obj:`list`: Names of the stored measurements"""
+        return [_decode_name(name) for name in self.file.get('measurements', {}).keys()]
+
+    @property
+    def fit_result_names(self):
+        """:obj:`list`: Names of the stored fit results"""
+        return [_decode_name(name) for name in self.file.get('fit_results', {}).keys()]
+
+    def _create_dataset(self, group, name, data):
+        data = np.asarray(data)
+        if data.ndim == 0:
+            return group.create_dataset(name, data=data)
+        return group.create_dataset(name, data=data, chunks=True, compression=self.compression)
+
+    def add_measurement(self, hdxm, overwrite=False):
+        """
+        Stores a :class:`~pyhdx.models.HDXMeasurement` under its name.
+
+        Parameters
+        ----------
+        hdxm : :class:`~pyhdx.models.HDXMeasurement`
+        overwrite : :obj:`bool`
+            If `True`, an existing measurement with the same name is replaced.
+
+        """
+        group_name = f'measurements/{_encode_name(hdxm.name)}'
+        if group_name in self.file:
+            if not overwrite:
+                raise ValueError(f"Measurement '{hdxm.name}' already exists in the project")
+            del self.file[group_name]
+
+        group = self.file.create_group(group_name)
+        data = np.concatenate([peptides.data for peptides in hdxm.peptides])
+        self._create_dataset(group, 'data', _encode_array(data))
+        self._create_dataset(group, 'X', hdxm.coverage.X)
+        group.attrs['metadata'] = _to_json(hdxm.metadata)
+        self._measurements[hdxm.name] = hdxm
+
+    def get_measurement(self, name):
+        """
+        Returns the stored :class:`~pyhdx.models.HDXMeasurement` with name `name`. Measurements are read from the file
+        on first access.
+
+        """
+        try:
+            return self._measurements[name]
+        except KeyError:
+            pass
+
+        try:
+            group = self.file['measurements'][_encode_name(name)]
+        except KeyError:
+            raise ValueError(f"Measurement '{name}' not found in the project")
+
+        data = _decode_array(group['data'][()])
+        hdxm = HDXMeasurement(data, **json.loads(group.attrs['metadata']))
+        self._measurements[name] = hdxm
+
+        return hdxm
+
+    def add_fit_result(self, fit_result, name, overwrite=False):
+        """
+        Stores a fit result and the measurements it refers to. Measurements are matched by name and are only added
+        when not yet in the project.
+
+        Parameters
+        ----------
+        fit_result : :class:`~pyhdx.fitting_torch.TorchFitResult` or :class:`~pyhdx.fitting.KineticsFitResult`
+            Fit result to store. The optimizer state of PyTorch fit results is not stored.
+        name : :obj:`str`
+            Name of the fit result in the project
+        overwrite : :obj:`bool`
+            If `True`, an existing fit result with the same name is replaced.
+
+        """
+        group_name = f'fit_results/{_encode_name(name)}'
+        if group_name in self.file:
+            if not overwrite:
+                raise ValueError(f"Fit result '{name}' already exists in the project")
+            del self.file[group_name]
+
+        if isinstance(fit_result, KineticsFitResult):
+            data_obj = fit_result.hdxm
+        elif type(fit_result).__name__ in TORCH_RESULT_TYPES:
+            data_obj = fit_result.data_obj
+        else:
+            raise TypeError(f"Unsupported fit result type: {type(fit_result).__name__}")
+
+        hdxm_list = data_obj.hdxm_list if isinstance(data_obj, HDXMeasurementSet) else [data_obj]
+        for hdxm in hdxm_list:
+            if hdxm.name not in self.measurement_names:
+                self.add_measurement(hdxm)
+
+        group = self.file.create_group(group_name)
+        group.attrs['type'] = type(fit_result).__name__
+        group.attrs['measurements'] = _to_json([hdxm.name for hdxm in hdxm_list])
+
+        if isinstance(fit_result, KineticsFitResult):
+            self._create_dataset(group, 'intervals', fit_result.intervals)
+            self._create_dataset(group, 'chi_squared', [result.chi_squared for result in fit_result.results])
+            group.attrs['params'] = _to_json([result.params for result in fit_result.results])
+            group.attrs['models'] = _to_json([{'type': type(model).__name__, 'bounds': model.bounds,
+                                               'param_state': model.param_state} for model in fit_result.models])
+        else:
+            if isinstance(data_obj, HDXMeasurementSet):
+                for attr in ['aligned_indices', 'aligned_pairs']:
+                    if getattr(data_obj, attr) is not None:
+                        self._create_dataset(group, attr, getattr(data_obj, attr))
+
+            model_group = group.create_group('model')
+            for key, value in fit_result.model.state_dict().items():
+                self._create_dataset(model_group, key, value.detach().numpy())
+
+            metadata_group = group.create_group('metadata')
+            metadata = {}
+            for key, value in fit_result.metadata.items():
+                if key == 'optimizer_state':
+                    continue
+                elif isinstance(value, np.ndarray):
+                    self._create_dataset(metadata_group, key, value)
+                else:
+                    metadata[key] = value
+            metadata_group.attrs['metadata'] = _to_json(metadata)
+
+    def get_fit_result(self, name):
+        """
+        Returns the stored fit result with name `name`, together with the measurements it refers to.
+
+        """
+        try:
+            group = self.file['fit_results'][_encode_name(name)]
+        except KeyError:
+            raise ValueError(f"Fit result '{name}' not found in the project")
+
+        hdxm_list = [self.get_measurement(hdxm_name) for hdxm_name in json.loads(group.attrs['measurements'])]
+        result_type = group.attrs['type']
+
+        if result_type == 'KineticsFitResult':
+            models = []
+            for spec in json.loads(group.attrs['models']):
+                model = getattr(pyhdx.fit_models, spec['type'])(tuple(spec['bounds']))
+                model.param_state = spec['param_state']
+                models.append(model)
+            results = [KineticsResult(chi_squared, params) for chi_squared, params
+                       in zip(group['chi_squared'][()], json.loads(group.attrs['params']))]
+            intervals = [tuple(interval) for interval in group['intervals'][()]]
+
+            return KineticsFitResult(hdxm_list[0], intervals, results, models)
+
+        if result_type == 'TorchBatchFitResult':
+            data_obj = HDXMeasurementSet(hdxm_list)
+            for attr in ['aligned_indices', 'aligned_pairs']:
+                if attr in group:
+                    setattr(data_obj, attr, group[attr][()])
+        else:
+            data_obj = hdxm_list[0]
+
+        arrays = {key: dataset[()] for key, dataset in group['model'].items()}
+        if 'block_index' in arrays:
+            model = BlockDeltaGFit(torch.nn.Parameter(torch.tensor(arrays['deltaG_blocks'])), arrays['block_index'])
+        else:
+            model = DeltaGFit(torch.nn.Parameter(torch.tensor(arrays['deltaG'])))
+
+        metadata = json.loads(group['metadata'].attrs['metadata'])
+        metadata.update({key: dataset[()] for key, dataset in group['metadata'].items()})
+
+        return TORCH_RESULT_TYPES[result_type](data_obj, model, **metadata)
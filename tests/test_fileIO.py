@@ -1,7 +1,8 @@
-from pyhdx.fileIO import csv_to_protein, txt_to_np, read_dynamx, fmt_export, csv_to_np
+from pyhdx.fileIO import csv_to_protein, txt_to_np, read_dynamx, fmt_export, csv_to_np, DataCache
 from pyhdx.models import Protein
 from pathlib import Path
 from io import StringIO
+import os
 import numpy as np
 import pytest
 
@@ -35,6 +36,66 @@ class TestFileIO(object):
             data = read_dynamx(StringIO(f.read()))
             assert data.size == 567
 
+        fpath_dimer = directory / 'test_data' / 'ecSecB_dimer.csv'
+        data = read_dynamx(self.fpath, fpath_dimer)
+        data_numpy = read_dynamx(self.fpath, fpath_dimer, engine='numpy')
+        assert data.dtype.names == data_numpy.dtype.names
+        for name in ['start', 'end', 'sequence', 'state', 'exposure', 'uptake', 'maxuptake']:
+            assert np.array_equal(data[name], np.asarray(data_numpy[name]))
+
+        with pytest.raises(ValueError):
+            data = read_dynamx(self.fpath, engine='foo')
+
+    def test_read_dynamx_selection(self):
+        data = read_dynamx(self.fpath)
+        selected = read_dynamx(self.fpath, states=['SecB WT apo'], exposures=[0.167, 10.], residue_range=(20, 100),
+                               chunk_size=50)
+        mask = (data['state'] == 'SecB WT apo') & np.isin(data['exposure'], [0.167, 10.]) & \
+               (data['start'] >= 20) & (data['end'] <= 101)
+        assert len(selected) == mask.sum()
+        assert np.array_equal(selected['uptake'], data['uptake'][mask])
+
+        selected_numpy = read_dynamx(self.fpath, states=['SecB WT apo'], engine='numpy')
+        assert len(selected_numpy) == np.sum(data['state'] == 'SecB WT apo')
+
+    def test_read_dynamx_parallel(self):
+        sequential = read_dynamx(self.fpath, self.fpath, max_workers=1)
+        parallel = read_dynamx(self.fpath, self.fpath, max_workers=2, states=['SecB WT apo'])
+        assert np.array_equal(sequential[sequential['state'] == 'SecB WT apo'], parallel)
+
+    def test_cache(self, tmp_path):
+        cache = DataCache(tmp_path)
+        data = read_dynamx(self.fpath, cache=cache)
+        assert len(list(tmp_path.glob('*.npy'))) == 1
+
+        cached = read_dynamx(self.fpath, cache=cache)
+        assert isinstance(cached, np.memmap)
+        assert np.array_equal(data, cached)
+
+        data = read_dynamx(self.fpath, intervals=('exclusive', 'inclusive'), cache=cache)
+        assert data['start'][0] == 10
+        assert len(list(tmp_path.glob('*.npy'))) == 2
+
+        small_cache = DataCache(tmp_path, max_size=data.nbytes + 1000)
+        small_cache.evict()
+        assert len(list(tmp_path.glob('*.npy'))) == 1
+        assert small_cache.load(cache.key([self.fpath], intervals=('exclusive', 'inclusive'), engine='c')) is not None
+
+        DataCache(tmp_path, max_size=0).evict()
+        assert len(list(tmp_path.glob('*.npy'))) == 0
+
+    def test_cache_in_use(self, tmp_path, monkeypatch):
+        cache = DataCache(tmp_path)
+        read_dynamx(self.fpath, cache=cache)
+
+        def remove(path):  # Memory mapped files cannot be removed on Windows
+            raise PermissionError
+
+        monkeypatch.setattr(os, 'remove', remove)
+        DataCache(tmp_path, max_size=0).evict()
+        cache.clear()
+        assert len(list(tmp_path.glob('*.npy'))) == 1
+
     def test_fmt_export(self):
         # testing fmt_export
         data = read_dynamx(self.fpath)
@@ -1,12 +1,18 @@
 import os
 from pyhdx import PeptideMasterTable, HDXMeasurement
 from pyhdx.fileIO import read_dynamx, csv_to_protein
-from pyhdx.fitting import fit_rates_weighted_average, fit_gibbs_global, fit_gibbs_global_batch, fit_gibbs_global_batch_aligned
+from pyhdx.fitting import fit_rates_weighted_average, fit_rates_weighted_average_vectorized, fit_gibbs_global, fit_gibbs_global_batch, fit_gibbs_global_batch_aligned, \
+    fit_gibbs_regularization_path, fit_gibbs_global_resampled, fit_gibbs_global_multi, FitProgress, \
+    compact_result, fit_compact, fit_gibbs_global_scipy, gibbs_loss_gradient, fit_gibbs_cross_validation
+from pyhdx.fitting_torch import estimate_errors, DeltaGFit
 from pyhdx.models import HDXMeasurementSet
 import numpy as np
 import torch
 import time
-from dask.distributed import LocalCluster
+import pickle
+import warnings
+import pandas as pd
+from dask.distributed import LocalCluster, Client
 
 directory = os.path.dirname(__file__)
 np.random.seed(43)
@@ -25,6 +31,7 @@ class TestSecBDataFit(object):
 
         pf = PeptideMasterTable(data, drop_first=1, ignore_prolines=True, remove_nan=False)
         pf.set_control(control)
+        cls.pf = pf
         cls.series_apo = HDXMeasurement(pf.get_state('SecB WT apo'), temperature=cls.temperature, pH=cls.pH)
         cls.series_dimer = HDXMeasurement(pf.get_state('SecB his dimer apo'), temperature=cls.temperature, pH=cls.pH)
 
@@ -41,11 +48,34 @@ class TestSecBDataFit(object):
 
         assert output.size == 100
 
+        # Models of the same type share a single compiled symfit model
+        assert all(model.sf_model is result.models[0].sf_model for model in result.models)
+        # Fits use private parameters, the parameters of the shared model are not modified
+        sf_model = result.models[0].sf_model
+        assert all(p.min is None and p.max is None for p in sf_model.params)
+        bound_model = result.models[0].bind()
+        assert not any(p is q for p, q in zip(bound_model.params, sf_model.params))
+
+        # Rates are calculated from half-life times, check that uptake at t½ is 0.5
+        k1, k2, r = [result.get_param(name) for name in ['k1', 'k2', 'r']]
+        t_half = np.log(2) / result.rate
+        uptake = 1 - r * np.exp(-k1 * t_half) - (1 - r) * np.exp(-k2 * t_half)
+        assert np.allclose(uptake[~np.isnan(uptake)], 0.5)
+
         # todo additional tests:
         #  result = fit_rates_half_time_interpolate()
 
         # todo additional assert, compare to stored values
 
+    def test_initial_guess_vectorized(self):
+        result = fit_rates_weighted_average(self.reduced_series)
+        result_vectorized = fit_rates_weighted_average_vectorized(self.reduced_series)
+
+        assert len(result_vectorized.results) == len(result.results)
+        chi_squared = np.array([res.chi_squared for res in result.results])
+        chi_squared_vectorized = np.array([res.chi_squared for res in result_vectorized.results])
+        assert np.all(chi_squared_vectorized <= chi_squared * 1.01 + 1e-6)
+
     def test_global_fit(self):
         #kf = KineticsFitting(self.series_apo, bounds=(1e-2, 800), temperature=self.temperature, pH=self.pH)
         initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
@@ -63,6 +93,264 @@ class TestSecBDataFit(object):
         assert np.allclose(check_deltaG['covariance'], out_deltaG['covariance'], equal_nan=True, rtol=0.01)
         assert np.allclose(check_deltaG['k_obs'], out_deltaG['k_obs'], equal_nan=True, rtol=0.01)
 
+    def test_estimate_errors(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate'])
+        fr_global = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+
+        covariance = estimate_errors(self.series_apo, fr_global.deltaG)
+        covariance_autograd = estimate_errors(self.series_apo, fr_global.deltaG, method='autograd')
+        assert np.allclose(covariance, covariance_autograd)
+
+    def test_sparse_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        fr_dense = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        fr_sparse = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, sparse=True)
+        assert np.allclose(fr_dense.deltaG, fr_sparse.deltaG)
+
+        hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer])
+        gibbs_guess = hdx_set.guess_deltaG([initial_rates['rate'], initial_rates['rate']])
+        fr_dense = fit_gibbs_global_batch(hdx_set, gibbs_guess, epochs=100)
+        fr_sparse = fit_gibbs_global_batch(hdx_set, gibbs_guess, epochs=100, sparse=True)
+        assert np.allclose(fr_dense.deltaG, fr_sparse.deltaG)
+        fr_packed = fit_gibbs_global_batch(hdx_set, gibbs_guess, epochs=100, packed=True)
+        assert np.allclose(fr_dense.deltaG, fr_packed.deltaG)
+
+        single_set = HDXMeasurementSet([self.series_apo])
+        gibbs_guess = single_set.guess_deltaG([initial_rates['rate']])
+        fr_dense = fit_gibbs_global_batch(single_set, gibbs_guess, epochs=100)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('error', message='Using a target size')  # Output must not be broadcast
+            fr_packed = fit_gibbs_global_batch(single_set, gibbs_guess, epochs=100, packed=True)
+        assert np.allclose(fr_dense.deltaG, fr_packed.deltaG)
+        assert np.allclose(fr_dense.metadata['total_loss'], fr_packed.metadata['total_loss'])
+
+    def test_chunked_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        fr = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        fr_chunked = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, memory_budget=2000)
+        assert np.allclose(fr.deltaG, fr_chunked.deltaG)
+        assert np.allclose(fr.metadata['total_loss'], fr_chunked.metadata['total_loss'])
+
+        hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer])
+        gibbs_guess = hdx_set.guess_deltaG([initial_rates['rate'], initial_rates['rate']])
+        fr = fit_gibbs_global_batch(hdx_set, gibbs_guess, epochs=100, packed=True)
+        fr_chunked = fit_gibbs_global_batch(hdx_set, gibbs_guess, epochs=100, packed=True, memory_budget=5000)
+        assert np.allclose(fr.deltaG, fr_chunked.deltaG)
+
+    def test_single_precision_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        fr_double = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        fr_single = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, dtype=torch.float32,
+                                     polish_epochs=0)
+        assert fr_single.model.deltaG.dtype == torch.float32
+        assert np.allclose(fr_double.deltaG, fr_single.deltaG, rtol=1e-3)
+
+        fr_polished = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, dtype=torch.float32,
+                                       polish_epochs=10)
+        assert fr_polished.model.deltaG.dtype == torch.float64
+        assert len(fr_polished.losses) == 110
+
+    def test_collapse_blocks(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        block_index = self.series_apo.coverage.block_index
+        assert len(block_index) == self.series_apo.Nr
+        assert block_index[-1] + 1 < self.series_apo.Nr
+
+        fr_blocks = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, collapse_blocks=True)
+        assert fr_blocks.model.deltaG_blocks.shape == (block_index[-1] + 1, 1)
+        assert len(fr_blocks.deltaG) == self.series_apo.Nr
+
+        deltaG = fr_blocks.deltaG.to_numpy()
+        assert np.all(deltaG[:-1][np.diff(block_index) == 0] == deltaG[1:][np.diff(block_index) == 0])
+
+    def test_fit_progress(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        progress = FitProgress(interval=0)
+        fr = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, callback=progress)
+        assert progress.progress['step'] == len(fr.losses)
+        assert not progress.cancelled
+
+        progress.cancel()
+        fr = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2, callback=progress)
+        assert len(fr.losses) == 1  # Cancelled after the first epoch
+
+        fr = fit_rates_weighted_average(self.series_apo, callback=lambda i, n, chisq: i >= 4)
+        assert len(fr.results) == 5
+
+        client = Client(self.address)
+        progress = FitProgress(name='pyhdx_test_progress', client=client, interval=0)
+        fr = client.submit(fit_gibbs_global, self.series_apo, gibbs_guess, epochs=100, r1=2, callback=progress).result()
+        assert progress.progress['step'] == len(fr.losses)
+        progress.close()
+        time.sleep(0.5)  # Variables are deleted asynchronously
+        variables = client.run_on_scheduler(lambda dask_scheduler: list(dask_scheduler.extensions['variables'].variables))
+        assert 'pyhdx_test_progress' not in variables
+        client.close()
+
+    def test_compact_result(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        fr_global = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        output = fr_global.output.df
+        size = len(pickle.dumps(fr_global))
+        compact = pickle.dumps(compact_result(fr_global))
+        assert len(compact) < size / 10
+
+        unpickled = pickle.loads(compact)
+        assert unpickled.data_obj is self.series_apo
+        pd.testing.assert_frame_equal(unpickled.output.df, output)
+
+        fr_compact = fit_compact(fit_gibbs_global, self.series_apo, gibbs_guess, epochs=100, r1=2)
+        assert len(pickle.dumps(fr_compact)) < size / 10
+
+        fr_kinetics = fit_rates_weighted_average(self.series_apo)
+        output = fr_kinetics.output.df
+        unpickled = pickle.loads(pickle.dumps(compact_result([fr_kinetics])))[0]
+        assert unpickled.hdxm is self.series_apo
+        pd.testing.assert_frame_equal(unpickled.output.df, output)
+
+    def test_scipy_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        tensors = self.series_apo.get_tensors()
+        deltaG = torch.nn.Parameter(torch.tensor(gibbs_guess).unsqueeze(-1))
+        output = DeltaGFit(deltaG)(tensors['temperature'], tensors['X'], tensors['k_int'], tensors['timepoints'])
+        loss = ((output - tensors['uptake'])**2).sum() + 2 * torch.mean(torch.abs(deltaG[:-1] - deltaG[1:]))
+        loss.backward()
+
+        mse_loss, total_loss, gradient = gibbs_loss_gradient(
+            gibbs_guess, self.series_apo.coverage.X_sparse, self.series_apo.coverage['k_int'].to_numpy(),
+            self.series_apo.timepoints, self.series_apo.temperature, self.series_apo.uptake_corrected.T, r1=2)
+        assert np.isclose(total_loss, loss.item())
+        assert np.allclose(gradient, deltaG.grad.numpy().squeeze())
+
+        fr_scipy = fit_gibbs_global_scipy(self.series_apo, gibbs_guess, r1=2)
+        fr_lbfgs = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=1000, r1=2, optimizer='LBFGS')
+        assert fr_scipy.total_loss < 1.1 * fr_lbfgs.total_loss
+
+        for method in ['TNC', 'SLSQP']:  # Callback receives the parameter vector or an OptimizeResult
+            fr = fit_gibbs_global_scipy(self.series_apo, gibbs_guess, r1=2, method=method,
+                                        callback=lambda epoch, epochs, loss: epoch >= 5)
+            assert len(fr.losses) == 6  # Initial loss and five iterations
+
+    def test_lbfgs_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate']).to_numpy()
+
+        fr_sgd = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=1000, r1=2)
+        fr_lbfgs = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=1000, r1=2, optimizer='LBFGS')
+
+        assert len(fr_lbfgs.losses) < 1000
+        assert fr_lbfgs.total_loss < fr_sgd.total_loss
+
+    def test_regularization_path(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate'])
+
+        r1_values = [0.5, 2]
+        path_result = fit_gibbs_regularization_path(self.series_apo, gibbs_guess, r1_values, epochs=100)
+        assert path_result.deltaG.shape == (self.series_apo.Nr, 2)
+        assert path_result.final_losses.shape == (2, 4)
+
+        for r1 in r1_values:
+            fr = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=r1)
+            assert np.allclose(fr.deltaG, path_result.deltaG[r1])
+            assert np.isclose(fr.total_loss, path_result.final_losses.loc[r1, 'total_loss'])
+
+        path_result_sparse = fit_gibbs_regularization_path(self.series_apo, gibbs_guess, r1_values, epochs=100,
+                                                           sparse=True)
+        assert np.allclose(path_result.deltaG, path_result_sparse.deltaG)
+
+    def test_warm_start(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate'])
+
+        fr_full = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=200, r1=2)
+        fr_first = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        fr_second = fit_gibbs_global(self.series_apo, fr_first, epochs=100, r1=2, reuse_optimizer_state=True)
+        assert np.allclose(fr_full.deltaG, fr_second.deltaG)
+
+        # Residues not covered in the previous fit are interpolated
+        data = self.series_apo.full_data
+        series_partial = HDXMeasurement(data[data['end'] < 100], temperature=self.temperature, pH=self.pH)
+        fr_partial = fit_gibbs_global(series_partial, series_partial.guess_deltaG(initial_rates['rate']), epochs=100)
+        fr_extended = fit_gibbs_global(self.series_apo, fr_partial, epochs=10)
+        assert fr_extended.deltaG.shape == (self.series_apo.Nr, )
+        assert np.all(np.isfinite(fr_extended.deltaG))
+
+    def test_resampling(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate'])
+        fr_global = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+
+        bootstrap = fit_gibbs_global_resampled(fr_global, num_samples=4, batch_size=2, epochs=100)
+        assert bootstrap.replicates.shape == (self.series_apo.Nr, 4)
+        output = bootstrap.output
+        assert np.all(output['deltaG_lower'].dropna() <= output['deltaG_upper'].dropna())
+
+        client = Client(self.address)
+        bootstrap_client = fit_gibbs_global_resampled(fr_global, num_samples=4, batch_size=2, epochs=100,
+                                                      client=client)
+        client.close()
+        assert np.allclose(bootstrap.replicates, bootstrap_client.replicates)
+
+        jackknife = fit_gibbs_global_resampled(fr_global, method='jackknife', epochs=100)
+        assert jackknife.replicates.shape == (self.series_apo.Nr, self.series_apo.Nt)
+
+    def test_cross_validation(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        gibbs_guess = self.series_apo.guess_deltaG(initial_rates['rate'])
+
+        cv = fit_gibbs_cross_validation(self.series_apo, gibbs_guess, [1, 10], k=3, epochs=100)
+        assert cv.scores.shape == (6, 4)
+        assert cv.recommended['r1'] in [1, 10]
+
+        client = Client(self.address)
+        cv_client = fit_gibbs_cross_validation(self.series_apo, gibbs_guess, [1, 10], k=3, epochs=100, client=client)
+        client.close()
+        pd.testing.assert_frame_equal(cv.scores, cv_client.scores)
+
+        hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer])
+        gibbs_guess = hdx_set.guess_deltaG([initial_rates['rate'], initial_rates['rate']])
+        cv = fit_gibbs_cross_validation(hdx_set, gibbs_guess, [1], [1, 10], k=2, holdout='timepoints', epochs=100)
+        assert list(cv.summary.index.names) == ['r1', 'r2']
+        assert len(cv.scores) == 4
+
+    def test_multi_fit(self):
+        initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+        hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer])
+        gibbs_guess = hdx_set.guess_deltaG([initial_rates['rate'], initial_rates['rate']])
+
+        results = fit_gibbs_global_multi(hdx_set, gibbs_guess, r1=2, epochs=1000, stop_loss=1)
+        assert len(results) == 2
+        assert len(results[0].losses) != len(results[1].losses)  # States converge independently
+        for result, hdxm in zip(results, hdx_set):
+            single = fit_gibbs_global(hdxm, hdxm.guess_deltaG(initial_rates['rate']), r1=2, epochs=1000, stop_loss=1)
+            assert len(result.losses) == len(single.losses)
+            assert np.allclose(result.deltaG, single.deltaG)
+            assert result.data_obj is hdxm
+
+        single_set = HDXMeasurementSet([self.series_apo])
+        results = fit_gibbs_global_multi(single_set, single_set.guess_deltaG([initial_rates['rate']]), r1=2,
+                                         epochs=1000, stop_loss=1)
+        single = fit_gibbs_global(self.series_apo, self.series_apo.guess_deltaG(initial_rates['rate']), r1=2,
+                                  epochs=1000, stop_loss=1)
+        assert len(results) == 1
+        assert np.allclose(results[0].deltaG, single.deltaG)
+
     def test_batch_fit(self):
         hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer])
         guess = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
@@ -102,3 +390,15 @@ class TestSecBDataFit(object):
             test = check_protein[state]['deltaG']
 
             assert_series_equal(result, test, rtol=0.1)
+
+        series_copy = HDXMeasurement(self.pf.get_state('SecB WT apo'), name='SecB WT apo copy', temperature=self.temperature,
+                                     pH=self.pH)
+        hdx_set = HDXMeasurementSet([self.series_apo, self.series_dimer, series_copy])
+        hdx_set.add_alignment([mock_alignment['apo'], mock_alignment['dimer'], mock_alignment['apo']])
+        assert hdx_set.aligned_pairs.shape[0] == 2
+        assert np.all(hdx_set.aligned_pairs[0] // hdx_set.Nr == 0)  # Aligned residues are paired to the first state
+
+        gibbs_guess = hdx_set.guess_deltaG([guess['rate']] * 3)
+        aligned_result = fit_gibbs_global_batch_aligned(hdx_set, gibbs_guess, r1=2, r2=5, epochs=1000)
+        assert np.allclose(aligned_result.output['SecB WT apo']['deltaG'],
+                           aligned_result.output['SecB WT apo copy']['deltaG'], rtol=1e-3, equal_nan=True)
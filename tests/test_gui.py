@@ -55,6 +55,7 @@ class TestMainGUISecB(object):
         file_input_control = ctrl.control_panels['PeptideFileInputControl']
 
         file_input_control.input_files = [binary]
+        ctrl.wait_futures()  # Wait until input files are read
         assert file_input_control.fd_state == 'Full deuteration control'
         assert file_input_control.fd_exposure == 0.0
 
@@ -87,6 +88,8 @@ class TestMainGUISecB(object):
         file_input = ctrl.control_panels['PeptideFileInputControl']
 
         file_input.input_files = files
+        ctrl.wait_futures()  # Wait until input files are read
+
         file_input.fd_state = 'Full deuteration control'
         file_input.fd_exposure = 0.167
 
@@ -229,6 +232,8 @@ class TestMainGUISimulated(object):
         file_input_control = ctrl.control_panels['PeptideFileInputControl']
 
         file_input_control.input_files = [binary]
+        ctrl.wait_futures()  # Wait until input files are read
+
         file_input_control.norm_mode = 'Theory'
         file_input_control.be_percent = 0.
 
@@ -1,7 +1,7 @@
 import pytest
 import os
 from pyhdx import PeptideMeasurements, PeptideMasterTable, HDXMeasurement
-from pyhdx.models import Protein, Coverage
+from pyhdx.models import Protein, Coverage, HDXMeasurementSet
 from pyhdx.fileIO import read_dynamx, txt_to_np, csv_to_protein
 import numpy as np
 from functools import reduce
@@ -78,6 +78,31 @@ class TestSeries(object):
 
         # assert ...
 
+        sparse_tensors = self.series.get_tensors(sparse=True)
+        assert sparse_tensors['X'].is_sparse
+        assert np.allclose(sparse_tensors['X'].to_dense().numpy(), tensors['X'].numpy())
+
+        hdx_set = HDXMeasurementSet([self.series, self.series])
+        set_tensors = hdx_set.get_tensors()
+        packed_tensors = hdx_set.get_tensors(packed=True)
+        Np, Nr = self.series.Np, hdx_set.Nr
+        assert packed_tensors['X'].shape == (2*Np, 2*Nr)
+        X_packed = packed_tensors['X'].to_dense().numpy()
+        assert np.allclose(X_packed[:Np, :Nr], set_tensors['X'][0].numpy())
+        assert np.allclose(X_packed[Np:, Nr:], set_tensors['X'][1].numpy())
+        assert np.allclose(packed_tensors['uptake'].numpy(), set_tensors['uptake'].numpy().reshape(2*Np, -1))
+
+    def test_pickling(self):
+        unpickled = pickle.loads(pickle.dumps(self.series))
+        assert unpickled.uid == self.series.uid
+
+        # Objects pickled without identifier get a new one
+        state = self.series.__dict__.copy()
+        del state['uid']
+        unpickled = HDXMeasurement.__new__(HDXMeasurement)
+        unpickled.__setstate__(state)
+        assert unpickled.uid != self.series.uid
+
 @pytest.mark.skip(reason="Simulated data was removed")
 class TestSimulatedData(object):
     @classmethod
@@ -112,6 +137,8 @@ class TestSimulatedData(object):
         #     assert np.sum(row) == 1
 
         assert peptides.X.shape == (len(self.data) / len(self.timepoints), self.end - self.start)
+        assert peptides.X_sparse.shape == peptides.X.shape
+        assert np.all(peptides.X_sparse.toarray() == peptides.X)
 
         #assert np.all(np.sum(peptides.X, axis=1) == 1)
 
@@ -0,0 +1,62 @@
+import os
+import pytest
+from pyhdx import PeptideMasterTable, HDXMeasurement
+from pyhdx.fileIO import read_dynamx, csv_to_protein
+from pyhdx.fitting import fit_gibbs_global, fit_rates_weighted_average
+import numpy as np
+import pandas as pd
+
+pytest.importorskip('h5py')
+from pyhdx.project import HDXProject
+
+directory = os.path.dirname(__file__)
+
+
+class TestHDXProject(object):
+    @classmethod
+    def setup_class(cls):
+        fpath = os.path.join(directory, 'test_data', 'ecSecB_apo.csv')
+        pf = PeptideMasterTable(read_dynamx(fpath), drop_first=1, ignore_prolines=True, remove_nan=False)
+        pf.set_control(('Full deuteration control', 0.167))
+
+        cls.temperature, cls.pH = 273.15 + 30, 8.
+        cls.state_data = pf.get_state('SecB WT apo')
+        cls.series_apo = HDXMeasurement(cls.state_data, temperature=cls.temperature, pH=cls.pH)
+        cls.initial_rates = csv_to_protein(os.path.join(directory, 'test_data', 'ecSecB_guess.txt'))
+
+    def test_project(self, tmp_path):
+        gibbs_guess = self.series_apo.guess_deltaG(self.initial_rates['rate'])
+        fr_global = fit_gibbs_global(self.series_apo, gibbs_guess, epochs=100, r1=2)
+        fr_kinetics = fit_rates_weighted_average(self.series_apo)
+
+        with HDXProject(tmp_path / 'project.h5', mode='w') as project:
+            project.add_fit_result(fr_global, 'global')
+            project.add_fit_result(fr_kinetics, 'kinetics')
+
+            with pytest.raises(ValueError):
+                project.add_fit_result(fr_global, 'global')
+
+        with HDXProject(tmp_path / 'project.h5', mode='r') as project:
+            assert project.measurement_names == ['SecB WT apo']
+            assert project.fit_result_names == ['global', 'kinetics']
+
+            result = project.get_fit_result('global')
+            pd.testing.assert_frame_equal(result.output.df, fr_global.output.df)
+            pd.testing.assert_frame_equal(result.losses, fr_global.losses)
+
+            result = project.get_fit_result('kinetics')
+            assert result.hdxm is project.get_measurement('SecB WT apo')
+            assert np.allclose(result.rate, fr_kinetics.rate, equal_nan=True)
+
+    def test_names(self, tmp_path):
+        name = 'SecB WT apo 30/40 %2F'
+        hdxm = HDXMeasurement(self.state_data, temperature=self.temperature, pH=self.pH, name=name)
+        fr_global = fit_gibbs_global(hdxm, hdxm.guess_deltaG(self.initial_rates['rate']), epochs=10, r1=2)
+
+        with HDXProject(tmp_path / 'project.h5', mode='w') as project:
+            project.add_fit_result(fr_global, 'fit 1/2')
+
+        with HDXProject(tmp_path / 'project.h5', mode='r') as project:
+            assert project.measurement_names == [name]
+            assert project.fit_result_names == ['fit 1/2']
+            assert project.get_fit_result('fit 1/2').data_obj.name == name